@@ -0,0 +1,248 @@
+"""Materialized per-vessel monthly aggregates of sf_consumption_logs.
+
+Usage:
+    python aggregates.py --db-url URL [--create | --rebuild] [--index]
+
+Each refresh re-aggregates, per vessel, the months from its high-water mark
+minus RESCAN_WINDOW onwards and replaces them in the monthly totals, so late
+and corrected reports in that window are taken in and the refresh can run
+from cron as often as needed. Works against PostgreSQL and against a SQLite
+stand-in. Tables created before the per-name keys and re-scan months were
+stored need --rebuild.
+"""
+import argparse
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from db import get_engine
+from queries import CII_RESULT_COLUMNS, FUEL_CO2_FACTORS, add_cii_columns
+
+# The months holding reports dated this close to a vessel's high-water mark are
+# re-aggregated on every refresh, so late or corrected reports replace what was counted
+RESCAN_WINDOW = timedelta(days=3)
+
+# Aggregate column prefix -> sf_consumption_logs column. Sums and non-null counts
+# are both kept, so the NULL rules of the CII queries can be applied on read
+AGGREGATE_SOURCES = {
+    'distance': 'DISTANCE_TRAVELLED_ACTUAL',
+    **{fuel.lower(): f'FUEL_CONSUMPTION_{fuel}' for fuel in FUEL_CO2_FACTORS},
+    **{f'fc_{fuel.lower()}': f'FC_FUEL_CONSUMPTION_{fuel}' for fuel in FUEL_CO2_FACTORS}
+}
+
+AGGREGATE_COLUMNS = [f'{name}_{stat}' for name in AGGREGATE_SOURCES for stat in ('sum', 'count')]
+
+# Year and month of "REPORT_DATE" per SQL dialect
+PERIOD_SQL = {
+    'postgresql': ('CAST(EXTRACT(YEAR FROM t1."REPORT_DATE") AS INTEGER)',
+                   'CAST(EXTRACT(MONTH FROM t1."REPORT_DATE") AS INTEGER)'),
+    'sqlite': ("CAST(strftime('%Y', t1.\"REPORT_DATE\") AS INTEGER)",
+               "CAST(strftime('%m', t1.\"REPORT_DATE\") AS INTEGER)")
+}
+
+CREATE_AGGREGATES_SQL = f"""
+    CREATE TABLE IF NOT EXISTS cii_vessel_aggregates (
+        vessel_imo BIGINT NOT NULL,
+        vessel_name TEXT NOT NULL,
+        period_year INTEGER NOT NULL,
+        period_month INTEGER NOT NULL,
+        {", ".join(f"{name}_sum DOUBLE PRECISION NOT NULL DEFAULT 0, {name}_count BIGINT NOT NULL DEFAULT 0"
+                   for name in AGGREGATE_SOURCES)},
+        report_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (vessel_imo, vessel_name, period_year, period_month)
+    )
+"""
+
+CREATE_WATERMARKS_SQL = """
+    CREATE TABLE IF NOT EXISTS cii_aggregate_watermarks (
+        vessel_imo BIGINT PRIMARY KEY,
+        last_report_date TIMESTAMP NOT NULL,
+        rescan_from TIMESTAMP NOT NULL
+    )
+"""
+
+# The per-vessel CII queries filter on VESSEL_NAME, the aggregate refresh joins on VESSEL_IMO
+REPORT_DATE_INDEX_SQL = [
+    """
+    CREATE INDEX IF NOT EXISTS sf_consumption_logs_name_report_date
+    ON "sf_consumption_logs" ("VESSEL_NAME", "REPORT_DATE")
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS sf_consumption_logs_vessel_report_date
+    ON "sf_consumption_logs" ("VESSEL_IMO", "REPORT_DATE")
+    """
+]
+
+NEW_ROWS_SQL = """
+    SELECT
+        t1."VESSEL_IMO" AS vessel_imo,
+        t1."VESSEL_NAME" AS vessel_name,
+        {year} AS period_year,
+        {month} AS period_month,
+        {sums},
+        COUNT(*) AS report_count,
+        MAX(t1."REPORT_DATE") AS last_report_date
+    FROM
+        "sf_consumption_logs" AS t1
+    LEFT JOIN
+        cii_aggregate_watermarks AS w ON w.vessel_imo = t1."VESSEL_IMO"
+    WHERE
+        t1."VESSEL_NAME" IS NOT NULL
+        AND (w.rescan_from IS NULL OR t1."REPORT_DATE" >= w.rescan_from)
+    GROUP BY
+        t1."VESSEL_IMO", t1."VESSEL_NAME", {year}, {month}
+"""
+
+# Months being re-aggregated are dropped first, so months whose reports were
+# all removed or renamed do not keep their old totals
+DELETE_RESCANNED_SQL = text("""
+    DELETE FROM cii_vessel_aggregates
+    WHERE vessel_imo = :vessel_imo
+        AND period_year * 100 + period_month >= :rescan_period
+""")
+
+INSERT_AGGREGATE_SQL = text(f"""
+    INSERT INTO cii_vessel_aggregates
+        (vessel_imo, vessel_name, period_year, period_month, {", ".join(AGGREGATE_COLUMNS)}, report_count)
+    VALUES
+        (:vessel_imo, :vessel_name, :period_year, :period_month,
+         {", ".join(f":{column}" for column in AGGREGATE_COLUMNS)}, :report_count)
+""")
+
+UPSERT_WATERMARK_SQL = text("""
+    INSERT INTO cii_aggregate_watermarks (vessel_imo, last_report_date, rescan_from)
+    VALUES (:vessel_imo, :last_report_date, :rescan_from)
+    ON CONFLICT (vessel_imo) DO UPDATE SET
+        last_report_date = excluded.last_report_date,
+        rescan_from = excluded.rescan_from
+""")
+
+AGGREGATED_VESSEL_DATA_SQL = f"""
+    SELECT
+        a.vessel_name AS "Vessel",
+        a.vessel_imo AS "IMO",
+        {", ".join(f"SUM(a.{column}) AS {column}" for column in AGGREGATE_COLUMNS)},
+        p."deadweight" AS "capacity",
+        p."vessel_type"
+    FROM
+        cii_vessel_aggregates AS a
+    LEFT JOIN
+        "vessel_particulars" AS p ON a.vessel_imo = p."vessel_imo"
+    WHERE
+        a.vessel_name = :vessel_name
+        AND a.period_year = :year
+        {{month_filter}}
+    GROUP BY
+        a.vessel_name, a.vessel_imo, p."deadweight", p."vessel_type"
+"""
+
+
+def create_aggregate_tables(conn):
+    """Create the aggregate and high-water-mark tables if they do not exist"""
+    conn.execute(text(CREATE_AGGREGATES_SQL))
+    conn.execute(text(CREATE_WATERMARKS_SQL))
+
+
+def drop_aggregate_tables(conn):
+    """Drop the aggregate and high-water-mark tables, so the next refresh rebuilds them from the logs"""
+    conn.execute(text("DROP TABLE IF EXISTS cii_vessel_aggregates"))
+    conn.execute(text("DROP TABLE IF EXISTS cii_aggregate_watermarks"))
+
+
+def create_report_date_index(conn):
+    """Index sf_consumption_logs for per-vessel date range scans"""
+    for statement in REPORT_DATE_INDEX_SQL:
+        conn.execute(text(statement))
+
+
+def new_rows_query(dialect_name):
+    """Return the query grouping log rows of each vessel's re-scanned months per name and month"""
+    year, month = PERIOD_SQL[dialect_name]
+    sums = ",\n        ".join(
+        f'COALESCE(SUM(t1."{source}"), 0) AS {name}_sum, COUNT(t1."{source}") AS {name}_count'
+        for name, source in AGGREGATE_SOURCES.items()
+    )
+    return text(NEW_ROWS_SQL.format(year=year, month=month, sums=sums))
+
+
+def rescan_start(last_report_date, rescan_window=RESCAN_WINDOW):
+    """Return the start of the month holding the high-water mark minus the re-scan window"""
+    return (pd.Timestamp(last_report_date) - rescan_window).to_period('M').start_time
+
+
+def refresh_aggregates(engine, rescan_window=RESCAN_WINDOW):
+    """Re-aggregate each vessel's months from its high-water mark minus rescan_window onwards.
+
+    Reports that arrive dated before the start of a vessel's re-scanned months
+    are not picked up; rebuild the tables to take in back-filled history.
+    Returns the number of log rows aggregated.
+    """
+    with engine.begin() as conn:
+        watermarks = pd.read_sql(text("SELECT vessel_imo, rescan_from FROM cii_aggregate_watermarks"), conn)
+        new_rows = pd.read_sql(new_rows_query(engine.dialect.name), conn)
+
+        rescanned = pd.to_datetime(watermarks['rescan_from'])
+        deletes = [{'vessel_imo': int(imo), 'rescan_period': start.year * 100 + start.month}
+                   for imo, start in zip(watermarks['vessel_imo'], rescanned)]
+        if deletes:
+            conn.execute(DELETE_RESCANNED_SQL, deletes)
+        if new_rows.empty:
+            return 0
+
+        aggregates = new_rows.drop(columns='last_report_date')
+        conn.execute(INSERT_AGGREGATE_SQL, aggregates.to_dict('records'))
+
+        marks = new_rows.groupby('vessel_imo', as_index=False)['last_report_date'].max()
+        marks['last_report_date'] = pd.to_datetime(marks['last_report_date'])
+        marks['rescan_from'] = marks['last_report_date'].map(lambda mark: rescan_start(mark, rescan_window))
+        records = [{'vessel_imo': int(row.vessel_imo), 'last_report_date': row.last_report_date.to_pydatetime(),
+                    'rescan_from': row.rescan_from.to_pydatetime()} for row in marks.itertuples()]
+        conn.execute(UPSERT_WATERMARK_SQL, records)
+        return int(new_rows['report_count'].sum())
+
+
+def fetch_aggregated_vessel_data(engine, vessel_name, year, month=None):
+    """Read one vessel's pre-aggregated year (or month) in the shape of fetch_vessel_data"""
+    params = {'vessel_name': vessel_name, 'year': year}
+    month_filter = ''
+    if month is not None:
+        month_filter = 'AND a.period_month = :month'
+        params['month'] = month
+    query = text(AGGREGATED_VESSEL_DATA_SQL.format(month_filter=month_filter))
+    df = pd.read_sql(query.execution_options(query_name='aggregated_vessel_data'), engine, params=params)
+    if df.empty:
+        return df
+
+    # Same NULL rules as the CII queries: SUM over no readings is NULL, and
+    # COALESCE((SUM(F) - SUM(FC)) * factor, 0) drops a fuel lacking either column
+    df['total_distance'] = df['distance_sum'].where(df['distance_count'] > 0)
+    for fuel in FUEL_CO2_FACTORS:
+        name = fuel.lower()
+        both_reported = (df[f'{name}_count'] > 0) & (df[f'fc_{name}_count'] > 0)
+        df[name] = (df[f'{name}_sum'] - df[f'fc_{name}_sum']).where(both_reported, 0.0)
+    return add_cii_columns(df)[CII_RESULT_COLUMNS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the materialized CII aggregates")
+    parser.add_argument("--db-url", required=True, help="SQLAlchemy database URL")
+    parser.add_argument("--create", action="store_true", help="Create the aggregate tables first")
+    parser.add_argument("--rebuild", action="store_true", help="Drop and recreate the aggregate tables first")
+    parser.add_argument("--index", action="store_true", help="Create the REPORT_DATE index on sf_consumption_logs")
+    args = parser.parse_args()
+
+    engine = get_engine(args.db_url)
+    if args.create or args.rebuild or args.index:
+        with engine.begin() as conn:
+            if args.rebuild:
+                drop_aggregate_tables(conn)
+            if args.create or args.rebuild:
+                create_aggregate_tables(conn)
+            if args.index:
+                create_report_date_index(conn)
+    print(f"Aggregated {refresh_aggregates(engine)} reports from the re-scanned months")
+
+
+if __name__ == '__main__':
+    main()
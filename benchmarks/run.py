@@ -0,0 +1,243 @@
+"""Benchmark the hot paths of the CII pipeline.
+
+Usage:
+    python -m benchmarks.run [--only port_lookup,fleet_rating] [--repeat 20]
+        [--vessels 50] [--years 2023 2024] [--reports-per-day 1] [--legs 10] [--fleet-size 10000]
+        [--db-url URL] [--baseline benchmarks/baseline.json] [--save-baseline] [--threshold 0.25]
+
+Each benchmark reports p50/p90/p99 latency, throughput and the tracemalloc
+peak of one extra run. Results are compared with the stored baseline;
+benchmarks whose p50 latency or peak memory grew by more than the threshold
+are flagged and the exit code is 1. Without --db-url, a synthetic SQLite
+database is seeded under .cache/.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+from benchmarks.synthetic_data import create_synthetic_database, vessel_name
+from cii_core import CII_ENGINE, calculate_cii_rating, calculate_reference_cii, calculate_required_cii
+from db import get_engine
+from port_data import PORTS_CSV_PATH, load_ports
+from port_index import PortIndex
+from queries import fetch_vessel_data
+from route_cache import RouteCache, compute_route, port_coordinates
+from voyage import evaluate_voyage
+from ytd_tracker import YTDTracker
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+BENCHMARK_DB_PATH = ".cache/benchmark.sqlite"
+
+# Well-known ports used to build voyages and routing pairs
+VOYAGE_PORTS = ['Singapore', 'Rotterdam', 'Shanghai', 'Santos', 'Houston', 'Durban', 'Busan', 'Algeciras',
+                'Jebel Ali', 'Los Angeles', 'Antwerp', 'Port Said', 'Colombo', 'Hamburg', 'Yokohama']
+
+# Benchmark: fn runs one iteration of `ops` operations, setup (untimed) runs before each iteration
+Benchmark = namedtuple('Benchmark', ['name', 'fn', 'ops', 'setup'])
+
+
+def measure(benchmark, repeat, warmup=1):
+    """Time a benchmark and return its latency, throughput and peak memory statistics"""
+    for _ in range(warmup):
+        if benchmark.setup:
+            benchmark.setup()
+        benchmark.fn()
+
+    times = []
+    for _ in range(repeat):
+        if benchmark.setup:
+            benchmark.setup()
+        start = time.perf_counter()
+        benchmark.fn()
+        times.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run so tracing overhead does not skew the timings
+    if benchmark.setup:
+        benchmark.setup()
+    tracemalloc.start()
+    benchmark.fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99]) * 1000
+    return {
+        'p50_ms': round(float(p50), 4),
+        'p90_ms': round(float(p90), 4),
+        'p99_ms': round(float(p99), 4),
+        'mean_ms': round(float(times.mean() * 1000), 4),
+        'throughput_per_s': round(float(benchmark.ops / times.mean()), 2),
+        'peak_kib': round(peak / 1024, 1),
+        'repeat': repeat
+    }
+
+
+def misspell(name, rng):
+    """Drop one character so the lookup falls through to fuzzy matching"""
+    if len(name) < 4:
+        return name
+    position = int(rng.integers(1, len(name) - 1))
+    return name[:position] + name[position + 1:]
+
+
+def port_benchmarks(port_index, rng, queries=200):
+    names = port_index.ports['Main Port Name'].astype(str).to_numpy()
+    exact = list(rng.choice(names, queries))
+    fuzzy = [misspell(name, rng) for name in rng.choice(names, queries)]
+
+    def lookup_all(batch):
+        return lambda: [port_index.lookup(query) for query in batch]
+
+    return [
+        Benchmark('port_lookup_exact', lookup_all(exact), queries, port_index.lookup_position.cache_clear),
+        Benchmark('port_lookup_fuzzy', lookup_all(fuzzy), queries, port_index.lookup_position.cache_clear),
+        Benchmark('port_lookup_memoized', lookup_all(fuzzy), queries, None),
+    ]
+
+
+def routing_benchmarks(port_index, legs, cache_dir):
+    ports = [port_index.lookup(name) for name in VOYAGE_PORTS]
+    pairs = [(ports[i % len(ports)], ports[(i + 1) % len(ports)]) for i in range(legs)]
+    rows = [[VOYAGE_PORTS[i % len(VOYAGE_PORTS)], VOYAGE_PORTS[(i + 1) % len(VOYAGE_PORTS)], 1, 12.5, 30, 'VLSFO']
+            for i in range(legs)]
+    caches = {}
+
+    def fresh_cache():
+        caches['cold'] = RouteCache(os.path.join(cache_dir, f"cold-{time.perf_counter_ns()}.sqlite"), version='bench')
+
+    warm_cache = RouteCache(os.path.join(cache_dir, 'warm.sqlite'), version='bench')
+
+    return [
+        Benchmark('route_searoute',
+                  lambda: [compute_route(port_coordinates(o), port_coordinates(d)) for o, d in pairs[:3]], 3, None),
+        Benchmark('route_cache_hit', lambda: [warm_cache.get_route(o, d) for o, d in pairs], legs, None),
+        Benchmark('voyage_segments_cold',
+                  lambda: evaluate_voyage(rows, port_index, caches['cold'], executor='thread'), legs, fresh_cache),
+        Benchmark('voyage_segments_cached',
+                  lambda: evaluate_voyage(rows, port_index, warm_cache, executor='thread'), legs, None),
+    ]
+
+
+def rating_benchmarks(fleet_size, rng):
+    ship_types = np.array(['bulk_carrier', 'tanker', 'container_ship', 'general_cargo_ship', 'gas_carrier'],
+                          dtype=object)[rng.integers(0, 5, fleet_size)]
+    capacities = rng.uniform(5000, 250000, fleet_size)
+    attained = rng.uniform(2, 20, fleet_size)
+
+    def scalar():
+        for capacity, ship_type, aer in zip(capacities, ship_types, attained):
+            calculate_cii_rating(aer, calculate_required_cii(calculate_reference_cii(capacity, ship_type), 2024))
+
+    return [
+        Benchmark('fleet_rating_scalar', scalar, fleet_size, None),
+        Benchmark('fleet_rating_vectorized', lambda: CII_ENGINE.evaluate(capacities, ship_types, 2024, attained),
+                  fleet_size, None),
+    ]
+
+
+def database_benchmarks(engine, vessels, year):
+    names = [vessel_name(number) for number in range(1, vessels + 1)]
+    # The harness owns its trackers, so the results do not depend on CII_USE_* settings
+    trackers = {'warm': YTDTracker()}
+
+    def fresh_tracker():
+        trackers['cold'] = YTDTracker()
+
+    def tracker_all(kind):
+        def run():
+            with engine.connect() as conn:
+                for name in names:
+                    trackers[kind].update(conn, name, year)
+        return run
+
+    return [
+        Benchmark('vessel_data_query', lambda: [fetch_vessel_data(engine, name, year) for name in names],
+                  len(names), None),
+        Benchmark('vessel_data_tracker_cold', tracker_all('cold'), len(names), fresh_tracker),
+        Benchmark('vessel_data_tracker_warm', tracker_all('warm'), len(names), None),
+    ]
+
+
+def compare(results, baseline, threshold):
+    """Return messages for benchmarks that regressed against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'peak_kib'):
+            if previous[metric] > 0 and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {result[metric]} "
+                                   f"(+{(result[metric] / previous[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CII pipeline hot paths")
+    parser.add_argument("--only", help="Comma separated benchmark name prefixes to run")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--vessels", type=int, default=20)
+    parser.add_argument("--years", type=int, nargs='+', default=[2023, 2024])
+    parser.add_argument("--reports-per-day", type=int, default=1)
+    parser.add_argument("--legs", type=int, default=10)
+    parser.add_argument("--fleet-size", type=int, default=10000)
+    parser.add_argument("--db-url", help="Seeded database to use instead of a synthetic SQLite file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown or memory growth")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    os.makedirs(os.path.dirname(BENCHMARK_DB_PATH), exist_ok=True)
+    db_url = args.db_url
+    if db_url is None:
+        db_url = f"sqlite:///{BENCHMARK_DB_PATH}"
+        written = create_synthetic_database(db_url, args.vessels, args.years, args.reports_per_day, index=True)
+        print(f"Seeded {written} synthetic reports into {BENCHMARK_DB_PATH}")
+
+    port_index = PortIndex(load_ports(PORTS_CSV_PATH))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        benchmarks = (port_benchmarks(port_index, rng)
+                      + routing_benchmarks(port_index, args.legs, cache_dir)
+                      + rating_benchmarks(args.fleet_size, rng)
+                      + database_benchmarks(get_engine(db_url), args.vessels, max(args.years)))
+        if args.only:
+            prefixes = tuple(args.only.split(','))
+            benchmarks = [benchmark for benchmark in benchmarks if benchmark.name.startswith(prefixes)]
+
+        results = {}
+        print(f"{'benchmark':<28}{'p50 ms':>12}{'p90 ms':>12}{'p99 ms':>12}{'ops/s':>14}{'peak KiB':>12}")
+        for benchmark in benchmarks:
+            # Routing with searoute is slow enough that a few runs suffice
+            repeat = min(args.repeat, 5) if benchmark.name in ('route_searoute', 'voyage_segments_cold') else args.repeat
+            result = results[benchmark.name] = measure(benchmark, repeat)
+            print(f"{benchmark.name:<28}{result['p50_ms']:>12.3f}{result['p90_ms']:>12.3f}{result['p99_ms']:>12.3f}"
+                  f"{result['throughput_per_s']:>14,.1f}{result['peak_kib']:>12,.1f}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    elif not baseline:
+        print("No baseline stored yet; run with --save-baseline to record one")
+    sys.exit(1 if regressions and not args.save_baseline else 0)
+
+
+if __name__ == '__main__':
+    main()
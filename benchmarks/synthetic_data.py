@@ -0,0 +1,99 @@
+"""Seed a database with synthetic noon reports for benchmarking.
+
+Usage:
+    python -m benchmarks.synthetic_data --db-url sqlite:///.cache/bench.sqlite \
+        [--vessels 50] [--years 2023 2024] [--reports-per-day 1] [--index]
+
+Creates (replacing) sf_consumption_logs and vessel_particulars with the
+columns the CII queries read. Vessels are named BENCH-0001, BENCH-0002, ...
+with IMO numbers from 9000001. The data is seeded, so runs are reproducible.
+"""
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from aggregates import create_report_date_index
+from cii_core import VESSEL_TYPE_MAPPING
+from queries import FUEL_CO2_FACTORS
+
+FIRST_IMO = 9000001
+
+# Fuels actually burnt by the synthetic fleet; the others stay at zero
+MAIN_FUELS = ['HFO', 'LFO', 'GO_DO']
+
+
+def vessel_name(number):
+    return f"BENCH-{number:04d}"
+
+
+def synthetic_particulars(vessels, seed=0):
+    """Return vessel_particulars rows for the synthetic fleet"""
+    rng = np.random.default_rng(seed)
+    vessel_types = list(VESSEL_TYPE_MAPPING)
+    return pd.DataFrame({
+        'vessel_imo': np.arange(FIRST_IMO, FIRST_IMO + vessels),
+        'vessel_name': [vessel_name(number) for number in range(1, vessels + 1)],
+        'deadweight': rng.integers(5000, 300000, vessels),
+        'vessel_type': [vessel_types[i % len(vessel_types)] for i in range(vessels)]
+    })
+
+
+def synthetic_reports(imo, name, years, reports_per_day=1, rng=None):
+    """Return the noon reports of one vessel over the given years"""
+    rng = rng or np.random.default_rng(imo)
+    start, end = date(min(years), 1, 1), date(max(years) + 1, 1, 1)
+    dates = pd.date_range(start, end, freq=pd.Timedelta(hours=24 / reports_per_day), inclusive='left')
+    n = len(dates)
+    at_sea = rng.random(n) < 0.7
+    reports = {
+        'VESSEL_IMO': np.full(n, imo),
+        'VESSEL_NAME': np.full(n, name, dtype=object),
+        'REPORT_DATE': dates,
+        'DISTANCE_TRAVELLED_ACTUAL': np.where(at_sea, rng.uniform(200, 380, n), 0) / reports_per_day
+    }
+    for fuel in FUEL_CO2_FACTORS:
+        consumed = rng.uniform(5, 40, n) * (at_sea if fuel == 'HFO' else 1) if fuel in MAIN_FUELS else np.zeros(n)
+        reports[f'FUEL_CONSUMPTION_{fuel}'] = consumed / reports_per_day
+        reports[f'FC_FUEL_CONSUMPTION_{fuel}'] = consumed * rng.uniform(0, 0.05, n) / reports_per_day
+    return pd.DataFrame(reports)
+
+
+def create_synthetic_database(db_url, vessels=50, years=(2023, 2024), reports_per_day=1, index=False, seed=0):
+    """Write the synthetic fleet and its reports; returns the number of reports written"""
+    engine = create_engine(db_url)
+    particulars = synthetic_particulars(vessels, seed)
+    particulars.drop(columns='vessel_name').to_sql('vessel_particulars', engine, if_exists='replace', index=False)
+
+    rng = np.random.default_rng(seed)
+    written = 0
+    for position, (imo, name) in enumerate(zip(particulars['vessel_imo'], particulars['vessel_name'])):
+        reports = synthetic_reports(int(imo), name, years, reports_per_day, rng)
+        reports.to_sql('sf_consumption_logs', engine, if_exists='replace' if position == 0 else 'append',
+                       index=False, chunksize=10000)
+        written += len(reports)
+
+    if index:
+        with engine.begin() as conn:
+            create_report_date_index(conn)
+    engine.dispose()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a database with synthetic CII data")
+    parser.add_argument("--db-url", required=True, help="SQLAlchemy URL of the database to seed")
+    parser.add_argument("--vessels", type=int, default=50)
+    parser.add_argument("--years", type=int, nargs='+', default=[2023, 2024])
+    parser.add_argument("--reports-per-day", type=int, default=1)
+    parser.add_argument("--index", action="store_true", help="Also create the report date index")
+    args = parser.parse_args()
+
+    written = create_synthetic_database(args.db_url, args.vessels, args.years, args.reports_per_day, args.index)
+    print(f"Wrote {written} reports for {args.vessels} vessels")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Headless JSON API over cii_core.
+
+Run with:
+    uvicorn cii_api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Endpoints:
+    GET  /health
+    GET  /cii/current?vessel_name=...&year=...
+    GET  /cii/legs?vessel_name=...&year=...
+    POST /cii/projection  {"vessel_name", "year", "legs": [...]} or {"current": {...}, "legs": [...]}
+    POST /cii/fleet       {"year", "imos": [...]}
+
+Voyage legs are objects with from_port, to_port, port_days, speed,
+fuel_used (mT/d) and fuel_type; ports are names, UN/LOCODEs or "lat, lon"
+positions, which snap to the nearest port. Blocking work (database, routing) runs in
+worker threads so the event loop keeps serving requests, and every request
+shares the pooled engine and caches of cii_core.
+"""
+import asyncio
+import json
+import math
+import sqlite3
+from datetime import date, datetime
+from urllib.parse import parse_qs
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from cii_core import CIIError, current_cii, fleet_cii, get_db_engine, get_leg_cache, get_port_index, project_voyage
+from tracing import export_trace, trace
+from voyage_reconstruction import vessel_legs
+
+LEG_FIELDS = ['from_port', 'to_port', 'port_days', 'speed', 'fuel_used', 'fuel_type']
+
+PORT_FIELDS = ('from_port', 'to_port')
+
+CURRENT_FIELDS = ['total_distance', 'co2_emission', 'capacity', 'required_cii']
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _year(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, "year must be an integer")
+
+
+def _port(value):
+    # A [lat, lon] position must be hashable to be resolved and memoized
+    return tuple(value) if isinstance(value, list) else value
+
+
+def current_endpoint(params):
+    vessel_name = params.get('vessel_name')
+    if not vessel_name:
+        raise HTTPError(400, "vessel_name is required")
+    return current_cii(get_db_engine(), vessel_name, _year(params.get('year', date.today().year)))
+
+
+def projection_endpoint(body):
+    legs = body.get('legs')
+    if not isinstance(legs, list) or not legs:
+        raise HTTPError(400, "legs must be a non-empty list")
+    try:
+        rows = [[_port(leg.get(field)) if field in PORT_FIELDS else leg.get(field) for field in LEG_FIELDS]
+                for leg in legs]
+    except AttributeError:
+        raise HTTPError(400, "each leg must be an object")
+
+    current = body.get('current')
+    if current is None:
+        if not body.get('vessel_name'):
+            raise HTTPError(400, "vessel_name or current is required")
+        current = current_cii(get_db_engine(), body['vessel_name'], _year(body.get('year', date.today().year)))
+    elif not isinstance(current, dict) or not all(field in current for field in CURRENT_FIELDS):
+        raise HTTPError(400, f"current must contain {', '.join(CURRENT_FIELDS)}")
+    else:
+        current = dict(current)
+        for field in CURRENT_FIELDS:
+            try:
+                current[field] = float(current[field])
+            except (TypeError, ValueError):
+                current[field] = math.nan
+            if not math.isfinite(current[field]):
+                raise HTTPError(400, f"current.{field} must be a number")
+
+    voyage_calculations, errors, projections = project_voyage(current, rows)
+    return {'current': current, 'segments': voyage_calculations, 'errors': errors, 'projection': projections}
+
+
+def legs_endpoint(params):
+    vessel_name = params.get('vessel_name')
+    if not vessel_name:
+        raise HTTPError(400, "vessel_name is required")
+    year = _year(params.get('year', date.today().year))
+    try:
+        legs = vessel_legs(get_db_engine(), get_leg_cache(), vessel_name, year, get_port_index().spatial)
+    except (SQLAlchemyError, sqlite3.Error) as e:
+        # Only database and leg cache failures are reported as CII errors; anything else is a server bug
+        raise CIIError(f"Error reconstructing voyage legs: {e}") from e
+    return {'legs': legs.astype(object).where(legs.notna(), None).to_dict(orient='records')}
+
+
+def fleet_endpoint(body):
+    imos = body.get('imos') or None
+    if imos is not None and not isinstance(imos, list):
+        raise HTTPError(400, "imos must be a list of IMO numbers")
+    try:
+        imos = [int(imo) for imo in imos] if imos else None
+    except (TypeError, ValueError):
+        raise HTTPError(400, "IMO numbers must be numeric")
+    report = fleet_cii(get_db_engine(), _year(body.get('year', date.today().year)), imos)
+    return {'vessels': report.astype(object).where(report.notna(), None).to_dict(orient='records')}
+
+
+ROUTES = {
+    ('GET', '/health'): lambda request: {'status': 'ok'},
+    ('GET', '/cii/current'): lambda request: current_endpoint(request['params']),
+    ('POST', '/cii/current'): lambda request: current_endpoint(request['body']),
+    ('GET', '/cii/legs'): lambda request: legs_endpoint(request['params']),
+    ('POST', '/cii/projection'): lambda request: projection_endpoint(request['body']),
+    ('POST', '/cii/fleet'): lambda request: fleet_endpoint(request['body']),
+}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, default=_json_default).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    method, path = scope['method'], scope['path'].rstrip('/') or '/'
+    handler = ROUTES.get((method, path))
+    try:
+        if handler is None:
+            allowed = any(route_path == path for _, route_path in ROUTES)
+            raise HTTPError(405 if allowed else 404, "Method not allowed" if allowed else "Not found")
+
+        raw_body = await _read_body(receive)
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        params = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+        try:
+            with trace('http.request', method=method, path=path) as request_trace:
+                # to_thread copies the context, so spans recorded by the handler join this trace
+                payload = await asyncio.to_thread(handler, {'params': params, 'body': body})
+        finally:
+            export_trace(request_trace)
+        await _send_json(send, 200, payload)
+    except HTTPError as e:
+        await _send_json(send, e.status, {'error': str(e)})
+    except CIIError as e:
+        await _send_json(send, 422, {'error': str(e)})
+    except Exception as e:
+        await _send_json(send, 500, {'error': f"Internal error: {e}"})
@@ -0,0 +1,296 @@
+"""CII calculations shared by the Streamlit app and the HTTP API.
+
+Nothing here depends on Streamlit: failures raise CIIError, and the port
+index, route cache, distance matrix and YTD tracker are process-wide
+singletons shared by every caller.
+"""
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+from aggregates import fetch_aggregated_vessel_data
+from cii_engine import CIIEngine, REDUCTION_FACTORS
+from db import PrometheusTextfileSink, connect, get_engine, set_metrics_sink
+from distance_matrix import DISTANCE_MATRIX_PATH, DistanceMatrix
+from port_data import PORTS_CSV_PATH, load_ports
+from port_index import PortIndex
+from queries import fetch_fleet_data, fetch_vessel_data
+from route_cache import ROUTE_CACHE_PATH, RouteCache, route_cache_version
+from tracing import span
+from voyage import evaluate_voyage
+from voyage_reconstruction import LEG_CACHE_PATH, LegCache
+from ytd_tracker import YTDTracker
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'aws-0-ap-south-1.pooler.supabase.com',
+    'database': 'postgres',
+    'user': 'postgres.conrxbcvuogbzfysomov',
+    'password': 'wXAryCC8@iwNvj#',
+    'port': '6543'
+}
+
+# Optional Prometheus textfile for database query and pool metrics
+if os.environ.get('CII_DB_METRICS_FILE'):
+    set_metrics_sink(PrometheusTextfileSink(os.environ['CII_DB_METRICS_FILE']))
+
+# Read current CII from the materialized aggregates maintained by aggregates.py
+USE_MATERIALIZED_AGGREGATES = os.environ.get('CII_USE_AGGREGATES') == '1'
+
+# Keep per-vessel running totals in process and only read reports added since the last call
+USE_YTD_TRACKER = os.environ.get('CII_USE_YTD_TRACKER') == '1'
+
+# Vessel type mapping remains the same as in your original code
+VESSEL_TYPE_MAPPING = {
+    'ASPHALT/BITUMEN TANKER': 'tanker',
+    'BULK CARRIER': 'bulk_carrier',
+    'CEMENT CARRIER': 'bulk_carrier',
+    'CHEM/PROD TANKER': 'tanker',
+    'CHEMICAL TANKER': 'tanker',
+    'Chemical/Products Tanker': 'tanker',
+    'Combination Carrier': 'combination_carrier',
+    'CONTAINER': 'container_ship',
+    'Container Ship': 'container_ship',
+    'Container/Ro-Ro Ship': 'ro_ro_cargo_ship',
+    'Crude Oil Tanker': 'tanker',
+    'Gas Carrier': 'gas_carrier',
+    'General Cargo Ship': 'general_cargo_ship',
+    'LNG CARRIER': 'lng_carrier',
+    'LPG CARRIER': 'gas_carrier',
+    'LPG Tanker': 'gas_carrier',
+    'OIL TANKER': 'tanker',
+    'Products Tanker': 'tanker',
+    'Refrigerated Cargo Ship': 'refrigerated_cargo_carrier',
+    'Ro-Ro Ship': 'ro_ro_cargo_ship',
+    'Vehicle Carrier': 'ro_ro_cargo_ship_vc'
+}
+
+# Reference line parameters; only the first row of each ship type is applied
+REFERENCE_CII_PARAMS = {
+    'bulk_carrier': [{'capacity_threshold': 279000, 'a': 4745, 'c': 0.622}],
+    'gas_carrier': [{'capacity_threshold': 65000, 'a': 144050000000, 'c': 2.071}],
+    'tanker': [{'capacity_threshold': float('inf'), 'a': 5247, 'c': 0.61}],
+    'container_ship': [{'capacity_threshold': float('inf'), 'a': 1984, 'c': 0.489}],
+    'general_cargo_ship': [{'capacity_threshold': float('inf'), 'a': 31948, 'c': 0.792}],
+    'refrigerated_cargo_carrier': [{'capacity_threshold': float('inf'), 'a': 4600, 'c': 0.557}],
+    'lng_carrier': [{'capacity_threshold': 100000, 'a': 144790000000000, 'c': 2.673}],
+}
+
+# Vectorized counterpart of the scalar CII functions below, for fleet-scale calculations
+CII_ENGINE = CIIEngine(REFERENCE_CII_PARAMS, dd_vectors=None, reduction_factors=REDUCTION_FACTORS, tiered=False)
+
+
+class CIIError(Exception):
+    """A CII calculation could not be completed; the message is meant for the user"""
+
+
+def get_db_engine():
+    """Return the shared, pooled database engine"""
+    return get_engine(os.environ.get('CII_DB_URL') or DB_CONFIG)
+
+
+@lru_cache(maxsize=None)
+def get_ytd_tracker():
+    """Return the process-wide year-to-date CII tracker"""
+    return YTDTracker()
+
+
+@lru_cache(maxsize=None)
+def load_world_ports():
+    """Load world ports data"""
+    return load_ports(PORTS_CSV_PATH)
+
+
+@lru_cache(maxsize=None)
+def get_port_index():
+    """Return the shared port name resolver"""
+    return PortIndex(load_world_ports())
+
+
+@lru_cache(maxsize=None)
+def get_route_cache():
+    """Return the shared sea route cache"""
+    return RouteCache(ROUTE_CACHE_PATH, version=route_cache_version(PORTS_CSV_PATH))
+
+
+@lru_cache(maxsize=None)
+def get_leg_cache():
+    """Return the shared cache of reconstructed voyage legs"""
+    return LegCache(LEG_CACHE_PATH, ports_version=route_cache_version(PORTS_CSV_PATH))
+
+
+@lru_cache(maxsize=None)
+def get_distance_matrix():
+    """Return the precomputed distance matrix if one matches the current route version"""
+    if not os.path.exists(f"{DISTANCE_MATRIX_PATH}.npy"):
+        return None
+    matrix = DistanceMatrix.load(DISTANCE_MATRIX_PATH)
+    if matrix.version != get_route_cache().version:
+        return None
+    return matrix
+
+
+def get_vessel_data(engine, vessel_name, year):
+    """Fetch the year-to-date CII inputs of a vessel"""
+    try:
+        with span('db.vessel_data', aggregates=USE_MATERIALIZED_AGGREGATES), connect(engine) as conn:
+            if USE_MATERIALIZED_AGGREGATES:
+                return fetch_aggregated_vessel_data(conn, vessel_name, year)
+            if USE_YTD_TRACKER:
+                return get_ytd_tracker().update(conn, vessel_name, year)
+            return fetch_vessel_data(conn, vessel_name, year)
+    except Exception as e:
+        raise CIIError(f"Error executing SQL query: {str(e)}") from e
+
+
+def get_fleet_data(engine, year, imos=None):
+    """Fetch annual data for the whole fleet (or the given IMOs) in one query"""
+    try:
+        with span('db.fleet_data'), connect(engine) as conn:
+            return fetch_fleet_data(conn, year, imos)
+    except Exception as e:
+        raise CIIError(f"Error executing SQL query: {str(e)}") from e
+
+
+def calculate_reference_cii(capacity, ship_type):
+    """Calculate reference CII based on capacity and ship type"""
+    ship_params = REFERENCE_CII_PARAMS.get(ship_type.lower())
+    if not ship_params:
+        raise CIIError(f"Unknown ship type: {ship_type}")
+
+    a, c = ship_params[0]['a'], ship_params[0]['c']
+    return a * (capacity ** -c)
+
+
+def calculate_required_cii(reference_cii, year):
+    """Calculate required CII based on reference CII and year"""
+    return reference_cii * REDUCTION_FACTORS.get(year, 1.0)
+
+
+def calculate_cii_rating(attained_cii, required_cii):
+    """Calculate CII rating based on attained and required CII"""
+    if attained_cii <= required_cii:
+        return 'A'
+    elif attained_cii <= 1.05 * required_cii:
+        return 'B'
+    elif attained_cii <= 1.1 * required_cii:
+        return 'C'
+    elif attained_cii <= 1.15 * required_cii:
+        return 'D'
+    else:
+        return 'E'
+
+
+def current_cii(engine, vessel_name, year):
+    """Calculate the year-to-date CII of a vessel"""
+    df = get_vessel_data(engine, vessel_name, year)
+    if df.empty:
+        raise CIIError(f"No data found for vessel {vessel_name} in year {year}")
+
+    vessel_type = df['vessel_type'].iloc[0]
+    imo_ship_type = VESSEL_TYPE_MAPPING.get(vessel_type)
+    capacity = df['capacity'].iloc[0]
+    attained_aer = df['Attained_AER'].iloc[0]
+
+    if imo_ship_type is None:
+        raise CIIError(f"The vessel type '{vessel_type}' is not supported for CII calculations.")
+    if attained_aer is None or pd.isna(attained_aer):
+        raise CIIError("Unable to calculate Attained AER. Please check the vessel's data.")
+
+    reference_cii = calculate_reference_cii(capacity, imo_ship_type)
+    required_cii = calculate_required_cii(reference_cii, year)
+    return {
+        'attained_aer': float(attained_aer),
+        'required_cii': float(required_cii),
+        'cii_rating': calculate_cii_rating(attained_aer, required_cii),
+        'total_distance': float(df['total_distance'].iloc[0]),
+        'co2_emission': float(df['CO2Emission'].iloc[0]),
+        'capacity': float(capacity),
+        'vessel_type': vessel_type,
+        'imo_ship_type': imo_ship_type
+    }
+
+
+def calculate_projected_cii(current_data, voyage_calculations):
+    """Calculate projected CII based on current data and planned voyage"""
+    if not voyage_calculations:
+        return None
+
+    # Sum up new voyage metrics
+    total_new_distance = sum(seg['distance'] for seg in voyage_calculations)
+    total_new_co2 = sum(seg['co2_emissions'] for seg in voyage_calculations)
+
+    # Get current annual values
+    current_distance = current_data.get('total_distance', 0)
+    current_co2 = current_data.get('co2_emission', 0)
+    capacity = current_data.get('capacity', 0)
+
+    if capacity <= 0:
+        raise CIIError("Error calculating projected CII: Invalid vessel capacity")
+
+    # Calculate combined metrics
+    total_distance = current_distance + total_new_distance
+    total_co2 = current_co2 + total_new_co2
+    if total_distance <= 0:
+        raise CIIError("Error calculating projected CII: Total distance must be positive")
+
+    # Calculate projected AER
+    projected_aer = (total_co2 * 1000000) / (total_distance * capacity)
+
+    return {
+        'projected_aer': projected_aer,
+        'new_distance': total_new_distance,
+        'new_co2': total_new_co2,
+        'total_distance': total_distance,
+        'total_co2': total_co2
+    }
+
+
+def project_voyage(current_data, rows):
+    """Evaluate voyage rows and project the CII after the voyage.
+
+    Returns (voyage_calculations, errors, projections): the metrics of every
+    leg that could be calculated, one message per failed leg, and the
+    projection (None when no leg could be calculated).
+    """
+    voyage_calculations = []
+    errors = []
+    results = evaluate_voyage(rows, get_port_index(), get_route_cache(), get_distance_matrix())
+    for leg_number, result in enumerate(results, start=1):
+        if result is None:
+            continue
+        if 'error' in result:
+            errors.append(f"Leg {leg_number}: {result['error']}")
+        else:
+            voyage_calculations.append(result)
+
+    with span('projection'):
+        projections = calculate_projected_cii(current_data, voyage_calculations)
+    if projections is not None:
+        projections['projected_rating'] = calculate_cii_rating(projections['projected_aer'],
+                                                               current_data['required_cii'])
+    return voyage_calculations, errors, projections
+
+
+def calculate_fleet_cii(fleet_df, year):
+    """Calculate required CII and rating for every vessel of a fleet query result"""
+    fleet_df = fleet_df.copy()
+    fleet_df['imo_ship_type'] = fleet_df['vessel_type'].map(VESSEL_TYPE_MAPPING)
+    results = CII_ENGINE.evaluate(
+        fleet_df['capacity'].to_numpy(dtype=float),
+        fleet_df['imo_ship_type'].to_numpy(dtype=object),
+        year,
+        fleet_df['Attained_AER'].to_numpy(dtype=float)
+    )
+    fleet_df['Required_CII'] = results['required_cii']
+    fleet_df['CII_Rating'] = results['rating']
+    return fleet_df
+
+
+def fleet_cii(engine, year, imos=None):
+    """Calculate the CII report of the whole fleet (or the given IMOs)"""
+    fleet_df = get_fleet_data(engine, year, imos)
+    if fleet_df.empty:
+        raise CIIError(f"No fleet data found for year {year}")
+    return calculate_fleet_cii(fleet_df, year)
@@ -0,0 +1,205 @@
+import numpy as np
+
+# Reference line parameters per IMO ship type, tiered by capacity threshold
+REFERENCE_CII_PARAMS = {
+    'bulk_carrier': [
+        {'capacity_threshold': 279000, 'a': 4745, 'c': 0.622, 'use_dwt': True},
+        {'capacity_threshold': float('inf'), 'a': 4745, 'c': 0.622, 'use_dwt': False}
+    ],
+    'gas_carrier': [
+        {'capacity_threshold': 65000, 'a': 144050000000, 'c': 2.071, 'use_dwt': True},
+        {'capacity_threshold': float('inf'), 'a': 8104, 'c': 0.639, 'use_dwt': True}
+    ],
+    'tanker': [{'capacity_threshold': float('inf'), 'a': 5247, 'c': 0.61, 'use_dwt': True}],
+    'container_ship': [{'capacity_threshold': float('inf'), 'a': 1984, 'c': 0.489, 'use_dwt': True}],
+    'general_cargo_ship': [
+        {'capacity_threshold': 20000, 'a': 31948, 'c': 0.792, 'use_dwt': True},
+        {'capacity_threshold': float('inf'), 'a': 588, 'c': 0.3885, 'use_dwt': True}
+    ],
+    'refrigerated_cargo_carrier': [{'capacity_threshold': float('inf'), 'a': 4600, 'c': 0.557, 'use_dwt': True}],
+    'combination_carrier': [{'capacity_threshold': float('inf'), 'a': 40853, 'c': 0.812, 'use_dwt': True}],
+    'lng_carrier': [
+        {'capacity_threshold': 100000, 'a': 144790000000000, 'c': 2.673, 'use_dwt': True},
+        {'capacity_threshold': 65000, 'a': 144790000000000, 'c': 2.673, 'use_dwt': True},
+        {'capacity_threshold': float('inf'), 'a': 9.827, 'c': 0, 'use_dwt': True}
+    ],
+    'ro_ro_cargo_ship_vc': [{'capacity_threshold': float('inf'), 'a': 5739, 'c': 0.631, 'use_dwt': False}],
+    'ro_ro_cargo_ship': [{'capacity_threshold': float('inf'), 'a': 10952, 'c': 0.637, 'use_dwt': True}],
+    'ro_ro_passenger_ship': [{'capacity_threshold': float('inf'), 'a': 7540, 'c': 0.587, 'use_dwt': False}],
+    'cruise_passenger_ship': [{'capacity_threshold': float('inf'), 'a': 930, 'c': 0.383, 'use_dwt': False}]
+}
+
+# Rating boundary vectors (d1..d4) per IMO ship type, tiered by capacity threshold
+DD_VECTORS = {
+    'bulk_carrier': [
+        {'capacity_threshold': 297000, 'd': [0.86, 0.94, 1.06, 1.18]},
+        {'capacity_threshold': float('inf'), 'd': [0.86, 0.94, 1.06, 1.18]}
+    ],
+    'tanker': [{'capacity_threshold': float('inf'), 'd': [0.82, 0.93, 1.08, 1.28]}],
+    'container_ship': [{'capacity_threshold': float('inf'), 'd': [0.83, 0.94, 1.07, 1.19]}],
+    'gas_carrier': [
+        {'capacity_threshold': 65000, 'd': [0.85, 0.95, 1.06, 1.25]},
+        {'capacity_threshold': float('inf'), 'd': [0.81, 0.91, 1.12, 1.44]}
+    ],
+    'lng_carrier': [
+        {'capacity_threshold': 65000, 'd': [0.78, 0.92, 1.10, 1.37]},
+        {'capacity_threshold': 100000, 'd': [0.78, 0.92, 1.10, 1.37]},
+        {'capacity_threshold': float('inf'), 'd': [0.89, 0.98, 1.06, 1.13]}
+    ],
+    'ro_ro_cargo_ship': [{'capacity_threshold': float('inf'), 'd': [0.66, 0.90, 1.11, 1.37]}],
+    'general_cargo_ship': [
+        {'capacity_threshold': 20000, 'd': [0.83, 0.94, 1.06, 1.19]},
+        {'capacity_threshold': float('inf'), 'd': [0.83, 0.94, 1.06, 1.19]}
+    ],
+    'refrigerated_cargo_carrier': [{'capacity_threshold': float('inf'), 'd': [0.78, 0.91, 1.07, 1.20]}],
+    'combination_carrier': [{'capacity_threshold': float('inf'), 'd': [0.87, 0.96, 1.06, 1.14]}],
+    'cruise_passenger_ship': [{'capacity_threshold': float('inf'), 'd': [0.87, 0.95, 1.06, 1.16]}],
+    'ro_ro_cargo_ship_vc': [{'capacity_threshold': float('inf'), 'd': [0.86, 0.94, 1.06, 1.16]}],
+    'ro_ro_passenger_ship': [{'capacity_threshold': float('inf'), 'd': [0.72, 0.90, 1.12, 1.41]}]
+}
+
+# Required CII reduction factors per year
+REDUCTION_FACTORS = {2023: 0.95, 2024: 0.93, 2025: 0.91, 2026: 0.89}
+
+# Fixed rating boundaries (multiples of required CII) used when no dd vectors are given
+RATING_MULTIPLIERS = [1.0, 1.05, 1.1, 1.15]
+
+RATINGS = np.array(['A', 'B', 'C', 'D', 'E'], dtype=object)
+
+
+def _compile_tiers(tiers):
+    """Drop tiers that can never be selected by a first-match capacity lookup"""
+    reachable = []
+    for tier in tiers:
+        if not reachable or tier['capacity_threshold'] > reachable[-1]['capacity_threshold']:
+            reachable.append(tier)
+    return reachable
+
+
+class CIIEngine:
+    """Array implementation of the reference, required and rating calculations.
+
+    The parameter tables are compiled into NumPy arrays once. Every method
+    takes arrays (or scalars) and returns the same values as the scalar
+    functions applied element by element (up to floating-point rounding of the
+    power function), with NaN reference/required CII and a None rating where
+    the ship type is unknown, the capacity out of range or an input missing.
+    With tiered=False only the first parameter row of a ship type is used,
+    regardless of capacity, as in the simplified app calculation.
+    """
+
+    def __init__(self, reference_params=REFERENCE_CII_PARAMS, dd_vectors=DD_VECTORS,
+                 reduction_factors=REDUCTION_FACTORS, tiered=True):
+        self.ship_types = sorted(reference_params)
+        self._codes = {ship_type: code for code, ship_type in enumerate(self.ship_types)}
+
+        self._reference = []
+        for ship_type in self.ship_types:
+            tiers = reference_params[ship_type]
+            if tiered:
+                tiers = _compile_tiers(tiers)
+            else:
+                tiers = [dict(tiers[0], capacity_threshold=float('inf'), use_dwt=True)]
+            self._reference.append((
+                np.array([tier['capacity_threshold'] for tier in tiers], dtype=float),
+                np.array([tier['a'] for tier in tiers], dtype=float),
+                np.array([tier['c'] for tier in tiers], dtype=float),
+                np.array([tier['use_dwt'] for tier in tiers], dtype=bool)
+            ))
+
+        self._dd = None
+        if dd_vectors is not None:
+            self._dd = []
+            for ship_type in self.ship_types:
+                tiers = _compile_tiers(dd_vectors.get(ship_type, []))
+                self._dd.append((
+                    np.array([tier['capacity_threshold'] for tier in tiers], dtype=float),
+                    np.exp(np.array([tier['d'] for tier in tiers], dtype=float).reshape(-1, 4))
+                ))
+
+        self.reduction_years = np.array(sorted(reduction_factors), dtype=np.int64)
+        self.reduction_values = np.array([reduction_factors[year] for year in self.reduction_years], dtype=float)
+
+    def ship_type_codes(self, ship_types):
+        """Map ship type names to table codes, -1 for unknown types"""
+        ship_types = np.atleast_1d(np.asarray(ship_types, dtype=object)).astype(str)
+        names, inverse = np.unique(ship_types, return_inverse=True)
+        codes = np.array([self._codes.get(name.lower(), -1) for name in names], dtype=np.int64)
+        return codes[inverse.reshape(ship_types.shape)]
+
+    def _broadcast(self, ship_types, capacities):
+        codes = ship_types if np.issubdtype(np.asarray(ship_types).dtype, np.integer) else self.ship_type_codes(ship_types)
+        codes, capacities = np.broadcast_arrays(np.atleast_1d(codes), np.atleast_1d(np.asarray(capacities, dtype=float)))
+        return codes, capacities
+
+    def reference_cii(self, capacities, ship_types):
+        """Reference CII for arrays of capacities and ship types (names or codes)"""
+        codes, capacities = self._broadcast(ship_types, capacities)
+        result = np.full(capacities.shape, np.nan)
+        for code in np.unique(codes[codes >= 0]):
+            mask = codes == code
+            thresholds, a, c, use_dwt = self._reference[code]
+            capacity = capacities[mask]
+            tier = np.searchsorted(thresholds, capacity, side='left')
+            in_range = tier < len(thresholds)
+            tier = np.minimum(tier, len(thresholds) - 1)
+            used_capacity = np.where(use_dwt[tier], capacity, thresholds[tier])
+            with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+                values = a[tier] * used_capacity ** -c[tier]
+            result[mask] = np.where(in_range, values, np.nan)
+        return result
+
+    def reduction_factors(self, years):
+        """Reduction factor per year, 1.0 for years outside the schedule"""
+        years = np.atleast_1d(np.asarray(years, dtype=np.int64))
+        if len(self.reduction_years) == 0:
+            return np.ones(years.shape)
+        position = np.searchsorted(self.reduction_years, years)
+        position = np.minimum(position, len(self.reduction_years) - 1)
+        known = self.reduction_years[position] == years
+        return np.where(known, self.reduction_values[position], 1.0)
+
+    def required_cii(self, reference_cii, years):
+        """Required CII for arrays of reference CII and years"""
+        return np.asarray(reference_cii, dtype=float) * self.reduction_factors(years)
+
+    def rating_bounds(self, required_cii, ship_types=None, capacities=None):
+        """Return the four A/B, B/C, C/D and D/E boundaries as an (n, 4) array"""
+        required_cii = np.atleast_1d(np.asarray(required_cii, dtype=float))
+        if self._dd is None:
+            return required_cii[:, None] * np.array(RATING_MULTIPLIERS)
+
+        codes, capacities = self._broadcast(ship_types, capacities)
+        codes, capacities, required_cii = np.broadcast_arrays(codes, capacities, required_cii)
+        bounds = np.full(required_cii.shape + (4,), np.nan)
+        for code in np.unique(codes[codes >= 0]):
+            mask = codes == code
+            thresholds, exp_d = self._dd[code]
+            if len(thresholds) == 0:
+                continue
+            tier = np.searchsorted(thresholds, capacities[mask], side='left')
+            in_range = tier < len(thresholds)
+            tier = np.minimum(tier, len(thresholds) - 1)
+            values = exp_d[tier] * required_cii[mask][:, None]
+            values[~in_range] = np.nan
+            bounds[mask] = values
+        return bounds
+
+    def rating(self, attained_cii, required_cii, ship_types=None, capacities=None):
+        """A-E rating for arrays of attained and required CII"""
+        bounds = self.rating_bounds(required_cii, ship_types, capacities)
+        attained_cii = np.broadcast_to(np.atleast_1d(np.asarray(attained_cii, dtype=float)), bounds.shape[:1])
+        ratings = RATINGS[(attained_cii[:, None] > bounds).sum(axis=1)]
+        ratings[np.isnan(attained_cii) | np.isnan(bounds).any(axis=1)] = None
+        return ratings
+
+    def evaluate(self, capacities, ship_types, years, attained_cii):
+        """Reference CII, required CII and rating for a batch of vessels"""
+        codes = self.ship_type_codes(ship_types)
+        reference = self.reference_cii(capacities, codes)
+        required = self.required_cii(reference, years)
+        return {
+            'reference_cii': reference,
+            'required_cii': required,
+            'rating': self.rating(attained_cii, required, codes, capacities)
+        }
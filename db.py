@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings of the process-wide engine
+DB_POOL_CONFIG = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def build_db_url(db_config):
+    """Build the SQLAlchemy URL from a DB_CONFIG dict"""
+    encoded_password = urllib.parse.quote(db_config['password'])
+    return f"postgresql+psycopg2://{db_config['user']}:{encoded_password}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
+
+
+class LogMetricsSink:
+    """Write every query and pool-wait measurement to the log"""
+
+    def record(self, metric):
+        if metric['kind'] == 'query':
+            logger.info("query %s took %.1f ms, %s rows", metric['name'], metric['duration'] * 1000, metric['rows'])
+        else:
+            logger.info("pool wait %.1f ms, %d connections checked out",
+                        metric['duration'] * 1000, metric['checked_out'])
+
+
+class PrometheusTextfileSink:
+    """Aggregate measurements and expose them as a Prometheus textfile-collector file"""
+
+    def __init__(self, path, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._queries = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'rows': 0})
+        self._pool = {'count': 0, 'seconds': 0.0, 'checked_out': 0}
+
+    def record(self, metric):
+        with self._lock:
+            if metric['kind'] == 'query':
+                totals = self._queries[metric['name']]
+                totals['count'] += 1
+                totals['seconds'] += metric['duration']
+                totals['rows'] += metric['rows'] or 0
+            else:
+                self._pool['count'] += 1
+                self._pool['seconds'] += metric['duration']
+                self._pool['checked_out'] = metric['checked_out']
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        lines = [
+            "# TYPE cii_db_queries_total counter",
+            *(f'cii_db_queries_total{{query="{name}"}} {totals["count"]}' for name, totals in self._queries.items()),
+            "# TYPE cii_db_query_seconds_total counter",
+            *(f'cii_db_query_seconds_total{{query="{name}"}} {totals["seconds"]:.6f}' for name, totals in self._queries.items()),
+            "# TYPE cii_db_query_rows_total counter",
+            *(f'cii_db_query_rows_total{{query="{name}"}} {totals["rows"]}' for name, totals in self._queries.items()),
+            "# TYPE cii_db_pool_waits_total counter",
+            f"cii_db_pool_waits_total {self._pool['count']}",
+            "# TYPE cii_db_pool_wait_seconds_total counter",
+            f"cii_db_pool_wait_seconds_total {self._pool['seconds']:.6f}",
+            "# TYPE cii_db_pool_checked_out gauge",
+            f"cii_db_pool_checked_out {self._pool['checked_out']}",
+        ]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+        self._last_flush = time.monotonic()
+
+
+_metrics_sink = LogMetricsSink()
+
+
+def set_metrics_sink(sink):
+    """Route query and pool metrics to another sink (any object with record(metric))"""
+    global _metrics_sink
+    _metrics_sink = sink
+
+
+def _record(metric):
+    try:
+        _metrics_sink.record(metric)
+    except Exception:
+        logger.exception("Failed to record database metric")
+
+
+def _instrument(engine):
+    """Time every statement executed through the engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        name = context.execution_options.get('query_name') if context is not None else None
+        _record({
+            'kind': 'query',
+            'name': name or statement.strip().split('\n', 1)[0][:60],
+            'duration': duration,
+            'rows': cursor.rowcount if cursor.rowcount >= 0 else None
+        })
+
+
+def get_engine(db_config, **pool_options):
+    """Return the process-wide pooled engine for a DB_CONFIG dict or URL, creating it on first use"""
+    url = db_config if isinstance(db_config, str) else build_db_url(db_config)
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            # SQLite stand-ins keep SQLAlchemy's default pool
+            options = {} if url.startswith('sqlite') else dict(DB_POOL_CONFIG)
+            engine = create_engine(url, **{**options, **pool_options})
+            _instrument(engine)
+            _engines[url] = engine
+        return engine
+
+
+@contextmanager
+def connect(engine):
+    """Check a connection out of the pool, recording how long the checkout took"""
+    start = time.perf_counter()
+    conn = engine.connect()
+    checked_out = engine.pool.checkedout() if hasattr(engine.pool, 'checkedout') else 0
+    _record({'kind': 'pool_wait', 'duration': time.perf_counter() - start, 'checked_out': checked_out})
+    try:
+        yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,131 @@
+"""Precompute the sea-route distance matrix of a fixed port network.
+
+Usage:
+    python distance_matrix.py ports.txt [--output data/distance_matrix] [--workers N]
+
+The port list holds one port per line (name, UN/LOCODE or World Port Index
+Number). The job writes <output>.npy (float32 NM, NaN where no route was
+found), <output>_ports.npy (the World Port Index Numbers indexing the rows and
+columns) and <output>_meta.json (the route cache version it was built with).
+"""
+import argparse
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from port_data import PORTS_CSV_PATH, load_ports
+from port_index import PortIndex
+from route_cache import compute_route, port_coordinates, port_key, route_cache_version
+
+# Default location of the precomputed matrix
+DISTANCE_MATRIX_PATH = "data/distance_matrix"
+
+_worker_coordinates = []
+
+
+def matrix_paths(path):
+    """Return the matrix, port list and metadata file names for an output prefix"""
+    return f"{path}.npy", f"{path}_ports.npy", f"{path}_meta.json"
+
+
+def _init_worker(coordinates):
+    global _worker_coordinates
+    _worker_coordinates = coordinates
+
+
+def _matrix_row(origin):
+    """Route one origin to every port of the network"""
+    row = np.full(len(_worker_coordinates), np.nan, dtype=np.float32)
+    for destination, destination_coords in enumerate(_worker_coordinates):
+        if destination == origin:
+            row[destination] = 0
+            continue
+        try:
+            row[destination] = compute_route(_worker_coordinates[origin], destination_coords)['length']
+        except Exception:
+            pass
+    return origin, row
+
+
+def resolve_ports(port_list, port_index):
+    """Resolve port names, LOCODEs or WPI numbers to unique World Port Index rows"""
+    by_key = port_index.ports.set_index(port_index.ports['World Port Index Number'].astype(int), drop=False)
+    ports = {}
+    for entry in port_list:
+        try:
+            port = by_key.loc[int(float(entry))]
+        except (ValueError, KeyError):
+            port = port_index.lookup(entry)
+        ports.setdefault(port_key(port), port)
+    return [ports[key] for key in sorted(ports)]
+
+
+def build_distance_matrix(ports, workers=None):
+    """Route all port pairs on a process pool and return the distance matrix"""
+    coordinates = [port_coordinates(port) for port in ports]
+    matrix = np.full((len(ports), len(ports)), np.nan, dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(coordinates,)) as pool:
+        for origin, row in pool.map(_matrix_row, range(len(ports))):
+            matrix[origin] = row
+    return matrix
+
+
+def save_distance_matrix(path, matrix, port_keys, version):
+    """Write the matrix, its port index and version metadata"""
+    matrix_path, ports_path, meta_path = matrix_paths(path)
+    np.save(matrix_path, matrix)
+    np.save(ports_path, np.asarray(port_keys, dtype=np.int32))
+    with open(meta_path, 'w') as f:
+        json.dump({'version': version, 'ports': len(port_keys)}, f)
+
+
+class DistanceMatrix:
+    """Memory-mapped all-pairs distance matrix indexed by World Port Index Number"""
+
+    def __init__(self, matrix, port_keys, version=''):
+        self.matrix = matrix
+        self.version = version
+        self._positions = {int(key): position for position, key in enumerate(port_keys)}
+
+    @classmethod
+    def load(cls, path=DISTANCE_MATRIX_PATH):
+        """Open a matrix written by save_distance_matrix"""
+        matrix_path, ports_path, meta_path = matrix_paths(path)
+        with open(meta_path) as f:
+            version = json.load(f)['version']
+        return cls(np.load(matrix_path, mmap_mode='r'), np.load(ports_path), version)
+
+    def lookup(self, origin_key, destination_key):
+        """Return the distance in NM between two ports, or None if not precomputed"""
+        origin = self._positions.get(origin_key)
+        destination = self._positions.get(destination_key)
+        if origin is None or destination is None:
+            return None
+        distance = float(self.matrix[origin, destination])
+        return None if math.isnan(distance) else distance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute sea-route distances between a list of ports")
+    parser.add_argument("port_list", help="Text file with one port name, UN/LOCODE or WPI number per line")
+    parser.add_argument("--output", default=DISTANCE_MATRIX_PATH, help="Output path prefix")
+    parser.add_argument("--workers", type=int, default=None, help="Number of routing processes")
+    args = parser.parse_args()
+
+    with open(args.port_list) as f:
+        port_list = [line.strip() for line in f if line.strip()]
+
+    port_index = PortIndex(load_ports(PORTS_CSV_PATH))
+    ports = resolve_ports(port_list, port_index)
+    print(f"Routing {len(ports)} ports ({len(ports) * (len(ports) - 1)} legs)")
+
+    matrix = build_distance_matrix(ports, workers=args.workers)
+    save_distance_matrix(args.output, matrix, [port_key(port) for port in ports],
+                         route_cache_version(PORTS_CSV_PATH))
+    print(f"Saved {matrix_paths(args.output)[0]} ({int(np.isnan(matrix).sum())} unroutable legs)")
+
+
+if __name__ == '__main__':
+    main()
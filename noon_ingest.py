@@ -0,0 +1,155 @@
+"""Per-vessel annual CII aggregates from noon-report exports.
+
+Usage:
+    python noon_ingest.py reports.parquet [more.csv ...] --particulars particulars.csv
+        [--years 2023 2024] [--chunksize 500000] [--output fleet_cii.csv]
+
+Exports use the sf_consumption_logs column names and are streamed in chunks
+(CSV through pandas, Parquet through pyarrow record batches), so memory
+depends on the number of vessel-years, not the number of reports. Fuel and
+FC_ columns are summed and netted exactly like the SQL queries: a fuel whose
+consumption or FC_ column has no value for the whole vessel-year adds no CO2.
+Vessel particulars (vessel_imo, deadweight, vessel_type) come from a file or,
+without --particulars, from the vessel_particulars table.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from queries import CII_RESULT_COLUMNS, FUEL_CO2_FACTORS, add_cii_columns
+
+KEY_COLUMNS = ['VESSEL_IMO', 'VESSEL_NAME']
+
+REQUIRED_COLUMNS = KEY_COLUMNS + ['REPORT_DATE', 'DISTANCE_TRAVELLED_ACTUAL']
+
+FUEL_COLUMNS = [f'FUEL_CONSUMPTION_{fuel}' for fuel in FUEL_CO2_FACTORS] + \
+               [f'FC_FUEL_CONSUMPTION_{fuel}' for fuel in FUEL_CO2_FACTORS]
+
+VALUE_COLUMNS = ['DISTANCE_TRAVELLED_ACTUAL'] + FUEL_COLUMNS
+
+DEFAULT_CHUNKSIZE = 500000
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def export_columns(path):
+    """Return the report columns present in an export, failing if a required one is missing"""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        available = set(pq.ParquetFile(path).schema_arrow.names)
+    else:
+        available = set(pd.read_csv(path, nrows=0).columns)
+    missing = [column for column in REQUIRED_COLUMNS if column not in available]
+    if missing:
+        raise ValueError(f"{path} is missing required columns: {', '.join(missing)}")
+    return [column for column in REQUIRED_COLUMNS + FUEL_COLUMNS if column in available]
+
+
+def iter_report_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield DataFrames of at most chunksize reports with every report column (absent fuels as NaN)"""
+    columns = export_columns(path)
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize,
+                                                                                      columns=columns))
+    else:
+        chunks = pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    for chunk in chunks:
+        yield chunk.reindex(columns=REQUIRED_COLUMNS + FUEL_COLUMNS)
+
+
+def chunk_totals(chunk, years=None):
+    """Sum and count the non-null values of every report column per vessel and year"""
+    chunk = chunk.assign(year=pd.to_datetime(chunk['REPORT_DATE']).dt.year)
+    if years is not None:
+        chunk = chunk[chunk['year'].isin(years)]
+    values = chunk[VALUE_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    grouped = values.groupby([chunk['VESSEL_IMO'], chunk['VESSEL_NAME'], chunk['year']])
+    return pd.concat([grouped.sum().add_suffix(':sum'), grouped.count().add_suffix(':count')], axis=1)
+
+
+class NoonReportAggregator:
+    """Running per-vessel annual totals over any number of report chunks"""
+
+    def __init__(self, years=None):
+        self.years = set(years) if years else None
+        self.totals = None
+        self.reports = 0
+
+    def add(self, chunk):
+        """Fold a chunk of reports into the totals"""
+        partial = chunk_totals(chunk, self.years)
+        self.reports += len(chunk)
+        if self.totals is None:
+            self.totals = partial
+        else:
+            self.totals = pd.concat([self.totals, partial]).groupby(level=[0, 1, 2]).sum()
+
+    def add_file(self, path, chunksize=DEFAULT_CHUNKSIZE):
+        for chunk in iter_report_chunks(path, chunksize):
+            self.add(chunk)
+
+    def result(self, particulars):
+        """Return one row per vessel-year in the shape of the CII queries, plus its year"""
+        if self.totals is None or self.totals.empty:
+            return pd.DataFrame(columns=['year'] + CII_RESULT_COLUMNS)
+        totals = self.totals
+        df = pd.DataFrame(index=totals.index)
+        # SUM over no values is NULL in SQL
+        df['total_distance'] = totals['DISTANCE_TRAVELLED_ACTUAL:sum'].where(
+            totals['DISTANCE_TRAVELLED_ACTUAL:count'] > 0)
+        for fuel in FUEL_CO2_FACTORS:
+            consumed, fc = f'FUEL_CONSUMPTION_{fuel}', f'FC_FUEL_CONSUMPTION_{fuel}'
+            both_reported = (totals[f'{consumed}:count'] > 0) & (totals[f'{fc}:count'] > 0)
+            df[fuel.lower()] = np.where(both_reported, totals[f'{consumed}:sum'] - totals[f'{fc}:sum'], 0.0)
+        df = df.reset_index().rename(columns={'VESSEL_IMO': 'IMO', 'VESSEL_NAME': 'Vessel'})
+
+        particulars = particulars.rename(columns={'vessel_imo': 'IMO', 'deadweight': 'capacity'})
+        df = df.merge(particulars[['IMO', 'capacity', 'vessel_type']], on='IMO', how='left')
+        df = add_cii_columns(df)
+        return df[['year'] + CII_RESULT_COLUMNS].sort_values(['year', 'Vessel']).reset_index(drop=True)
+
+
+def ingest_noon_reports(paths, particulars, years=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Stream report exports into per-vessel annual CII aggregates"""
+    aggregator = NoonReportAggregator(years)
+    for path in paths:
+        aggregator.add_file(path, chunksize)
+    return aggregator.result(particulars)
+
+
+def read_particulars(path):
+    """Read vessel particulars (vessel_imo, deadweight, vessel_type) from a CSV or Parquet file"""
+    return pd.read_parquet(path) if _is_parquet(path) else pd.read_csv(path)
+
+
+def main():
+    from cii_core import calculate_fleet_cii, get_db_engine
+
+    parser = argparse.ArgumentParser(description="Compute CII ratings from noon-report exports")
+    parser.add_argument("paths", nargs='+', help="CSV or Parquet exports with sf_consumption_logs columns")
+    parser.add_argument("--particulars", help="CSV or Parquet file of vessel particulars (default: database)")
+    parser.add_argument("--years", type=int, nargs='*')
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--output", default="fleet_cii.csv")
+    args = parser.parse_args()
+
+    if args.particulars:
+        particulars = read_particulars(args.particulars)
+    else:
+        particulars = pd.read_sql('SELECT "vessel_imo", "deadweight", "vessel_type" FROM "vessel_particulars"',
+                                  get_db_engine())
+
+    aggregates = ingest_noon_reports(args.paths, particulars, args.years, args.chunksize)
+    report = pd.concat([calculate_fleet_cii(group, int(year)) for year, group in aggregates.groupby('year')],
+                       ignore_index=True) if not aggregates.empty else aggregates
+    report.to_csv(args.output, index=False)
+    print(f"Wrote {len(report)} vessel-years to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
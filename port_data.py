@@ -0,0 +1,77 @@
+"""Slim, typed copy of the World Port Index dataset.
+
+Usage:
+    python port_data.py [--source UpdatedPub150.csv] [--output data/ports.feather]
+
+The app only needs a handful of the 100+ columns of UpdatedPub150.csv. This
+build step writes them to an uncompressed Feather (Arrow IPC) file with
+compact types, which load_ports reads memory-mapped. The artifact records a
+hash of the CSV it was built from and is ignored once the CSV changes.
+"""
+import argparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from route_cache import dataset_fingerprint
+
+PORTS_CSV_PATH = "UpdatedPub150.csv"
+PORTS_ARTIFACT_PATH = "data/ports.feather"
+
+# Columns used by the app and the types they are stored with
+PORT_DTYPES = {
+    'World Port Index Number': 'int32',
+    'Main Port Name': 'string',
+    'Alternate Port Name': 'string',
+    'UN/LOCODE': 'category',
+    'Country Code': 'category',
+    'Latitude': 'float32',
+    'Longitude': 'float32'
+}
+
+SOURCE_METADATA_KEY = b'source_fingerprint'
+
+
+def read_ports_csv(source=PORTS_CSV_PATH):
+    """Read only the needed columns of the World Port Index CSV"""
+    ports = pd.read_csv(source, usecols=list(PORT_DTYPES), dtype={
+        column: dtype for column, dtype in PORT_DTYPES.items() if dtype in ('string', 'category')
+    })
+    ports['World Port Index Number'] = ports['World Port Index Number'].astype(float).astype('int32')
+    ports['Latitude'] = ports['Latitude'].astype('float32')
+    ports['Longitude'] = ports['Longitude'].astype('float32')
+    return ports[list(PORT_DTYPES)]
+
+
+def build_ports_artifact(source=PORTS_CSV_PATH, output=PORTS_ARTIFACT_PATH):
+    """Convert the CSV into the slim Feather artifact"""
+    table = pa.Table.from_pandas(read_ports_csv(source), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_METADATA_KEY] = dataset_fingerprint(source).encode()
+    feather.write_feather(table.replace_schema_metadata(metadata), output, compression='uncompressed')
+    return table.num_rows
+
+
+def load_ports(source=PORTS_CSV_PATH, artifact=PORTS_ARTIFACT_PATH):
+    """Load the port dataset from the artifact, or from the CSV if the artifact is missing or stale"""
+    try:
+        table = feather.read_table(artifact, memory_map=True)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return read_ports_csv(source)
+    built_from = (table.schema.metadata or {}).get(SOURCE_METADATA_KEY, b'').decode()
+    if built_from != dataset_fingerprint(source):
+        return read_ports_csv(source)
+    return table.to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the slim port dataset artifact")
+    parser.add_argument("--source", default=PORTS_CSV_PATH, help="World Port Index CSV")
+    parser.add_argument("--output", default=PORTS_ARTIFACT_PATH, help="Feather file to write")
+    args = parser.parse_args()
+    print(f"Wrote {build_ports_artifact(args.source, args.output)} ports to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from fuzzywuzzy import process, utils
+
+# Number of trigram-ranked candidates handed to the fuzzy scorer
+FUZZY_CANDIDATES = 50
+
+# Positions farther than this (NM) from every port are not snapped to one
+MAX_SNAP_DISTANCE_NM = 50
+
+_POSITION_PATTERN = re.compile(
+    r'^\s*([-+]?\d+(?:\.\d+)?)\s*°?\s*([NS])?\s*[,;\s]\s*([-+]?\d+(?:\.\d+)?)\s*°?\s*([EW])?\s*$',
+    re.IGNORECASE
+)
+
+
+def normalize_port_name(name):
+    """Normalize a port name the same way fuzzywuzzy does before scoring"""
+    return utils.full_process(str(name), force_ascii=True)
+
+
+def normalize_locode(code):
+    """Normalize a UN/LOCODE such as 'SG SIN' to 'SGSIN'"""
+    return ''.join(str(code).split()).upper()
+
+
+def parse_position(value):
+    """Return (lat, lon) of a position such as '1.26, 103.84', '1.26N 103.84E' or (1.26, 103.84), else None"""
+    if isinstance(value, (tuple, list)) and len(value) == 2:
+        try:
+            lat, lon = float(value[0]), float(value[1])
+        except (TypeError, ValueError):
+            return None
+    else:
+        match = _POSITION_PATTERN.match(str(value))
+        if not match:
+            return None
+        lat, lat_hemisphere, lon, lon_hemisphere = match.groups()
+        lat = -float(lat) if (lat_hemisphere or '').upper() == 'S' else float(lat)
+        lon = -float(lon) if (lon_hemisphere or '').upper() == 'W' else float(lon)
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def name_trigrams(name):
+    """Return the set of padded character trigrams of a normalized name"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PortIndex:
+    """Port resolver built once from the World Port Index dataset.
+
+    Exact names, alternate names and UN/LOCODEs resolve through dict lookups.
+    Anything else is scored with fuzzywuzzy against a small set of candidates
+    pre-selected through a trigram index, instead of all ~3,800 port names.
+    Positions ('lat, lon') snap to the nearest port through a spatial index.
+    Resolved queries are memoized.
+    """
+
+    def __init__(self, world_ports_data, memo_size=4096, max_snap_distance_nm=MAX_SNAP_DISTANCE_NM):
+        self.ports = world_ports_data.reset_index(drop=True)
+        self.max_snap_distance_nm = max_snap_distance_nm
+        self._spatial = None
+        self._main_names = {}
+        self._alternate_names = {}
+        self._locodes = {}
+        # Candidate strings (main and alternate names) and the row each belongs to
+        self._candidates = []
+        self._candidate_rows = []
+        self._trigrams = defaultdict(list)
+
+        main_names = self.ports['Main Port Name'].astype(str).tolist()
+        alternate_names = self.ports['Alternate Port Name'].astype(object).fillna('').astype(str).tolist()
+        locodes = self.ports['UN/LOCODE'].astype(object).fillna('').astype(str).tolist()
+
+        for position, (main_name, alternates, locode) in enumerate(zip(main_names, alternate_names, locodes)):
+            normalized = normalize_port_name(main_name)
+            if normalized:
+                self._main_names.setdefault(normalized, position)
+                self._add_candidate(normalized, position)
+
+            for alternate in alternates.split(';'):
+                normalized = normalize_port_name(alternate)
+                if normalized:
+                    self._alternate_names.setdefault(normalized, position)
+                    self._add_candidate(normalized, position)
+
+            code = normalize_locode(locode)
+            if len(code) == 5:
+                self._locodes.setdefault(code, position)
+
+        self._all_main_names = dict(enumerate(main_names))
+        self.lookup_position = lru_cache(maxsize=memo_size)(self._lookup_position)
+
+    def _add_candidate(self, normalized, position):
+        candidate_id = len(self._candidates)
+        self._candidates.append(normalized)
+        self._candidate_rows.append(position)
+        for trigram in name_trigrams(normalized):
+            self._trigrams[trigram].append(candidate_id)
+
+    @property
+    def spatial(self):
+        """The nearest-port index, built on first use"""
+        if self._spatial is None:
+            from port_spatial import PortSpatialIndex
+            self._spatial = PortSpatialIndex(self.ports)
+        return self._spatial
+
+    def _lookup_position(self, port_to_match):
+        """Return the row position of the best matching port"""
+        position = parse_position(port_to_match)
+        if position is not None:
+            return self._snap_position(*position)
+
+        normalized = normalize_port_name(port_to_match)
+
+        if normalized in self._main_names:
+            return self._main_names[normalized]
+        code = normalize_locode(port_to_match)
+        if code in self._locodes:
+            return self._locodes[code]
+        if normalized in self._alternate_names:
+            return self._alternate_names[normalized]
+
+        candidates = self._fuzzy_candidates(normalized)
+        if candidates:
+            choices = {candidate_id: self._candidates[candidate_id] for candidate_id in candidates}
+            _, _, candidate_id = process.extractOne(normalized, choices, processor=None)
+            return self._candidate_rows[candidate_id]
+
+        # Nothing shares a trigram with the query, score every main name
+        _, _, position = process.extractOne(port_to_match, self._all_main_names)
+        return position
+
+    def _snap_position(self, lat, lon):
+        positions, _ = self.spatial.nearest([lat], [lon], self.max_snap_distance_nm)
+        if positions[0] < 0:
+            raise ValueError(f"No port within {self.max_snap_distance_nm:g} NM of {lat:.4f}, {lon:.4f}")
+        return int(positions[0])
+
+    def _fuzzy_candidates(self, normalized):
+        """Return the ids of the candidates sharing the most trigrams with the query"""
+        shared = defaultdict(int)
+        for trigram in name_trigrams(normalized):
+            for candidate_id in self._trigrams.get(trigram, ()):
+                shared[candidate_id] += 1
+        ranked = sorted(shared, key=lambda candidate_id: (-shared[candidate_id], candidate_id))
+        return ranked[:FUZZY_CANDIDATES]
+
+    def lookup(self, port_to_match):
+        """Return the World Port Index row of the best matching port"""
+        if isinstance(port_to_match, list):
+            # Positions decoded from JSON arrive as lists, which the memo cannot hash
+            port_to_match = tuple(port_to_match)
+        return self.ports.iloc[self.lookup_position(port_to_match)]
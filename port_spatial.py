@@ -0,0 +1,141 @@
+"""Nearest-port and within-radius queries on port positions.
+
+Usage:
+    python port_spatial.py positions.csv [--lat-column LAT] [--lon-column LON]
+        [--max-distance 20] [--chunksize 1000000] [--output snapped.csv]
+
+Ports are indexed as points on the unit sphere in a KD-tree, where the
+straight-line (chord) distance increases monotonically with the great-circle
+distance. Nearest neighbours and radius matches on the sphere are therefore
+exact, and batches of millions of positions are answered in vectorized calls.
+The CLI snaps the positions of a CSV to their nearest port in chunks.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Mean Earth radius in nautical miles
+EARTH_RADIUS_NM = 3440.065
+
+DEFAULT_CHUNKSIZE = 1000000
+
+
+def unit_vectors(lats, lons):
+    """Return (n, 3) unit-sphere coordinates of latitudes and longitudes in degrees"""
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    # Missing coordinates become non-finite rows, which the queries leave unmatched
+    with np.errstate(invalid='ignore'):
+        cos_lats = np.cos(lats)
+        return np.column_stack([cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)])
+
+
+def chord_to_nm(chords):
+    """Convert unit-sphere chord lengths to great-circle distances in NM"""
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.clip(np.asarray(chords, dtype=float) / 2, 0, 1))
+
+
+def nm_to_chord(distance_nm):
+    """Convert a great-circle distance in NM to the unit-sphere chord length"""
+    return 2 * np.sin(np.minimum(distance_nm / EARTH_RADIUS_NM, np.pi) / 2)
+
+
+class PortSpatialIndex:
+    """KD-tree over the Latitude/Longitude of the World Port Index rows"""
+
+    def __init__(self, world_ports_data):
+        self.ports = world_ports_data.reset_index(drop=True)
+        self._tree = cKDTree(unit_vectors(self.ports['Latitude'], self.ports['Longitude']))
+
+    def nearest(self, lats, lons, max_distance_nm=None):
+        """Return (row positions, distances in NM) of the nearest port to every position.
+
+        Positions without a port within max_distance_nm, or with a missing
+        coordinate, get row position -1 and an infinite distance.
+        """
+        upper_bound = np.inf if max_distance_nm is None else nm_to_chord(max_distance_nm) * (1 + 1e-9)
+        vectors = unit_vectors(lats, lons)
+        finite = np.isfinite(vectors).all(axis=1)
+        chords = np.full(len(vectors), np.inf)
+        positions = np.full(len(vectors), -1)
+        if finite.any():
+            chords[finite], positions[finite] = self._tree.query(vectors[finite], distance_upper_bound=upper_bound,
+                                                                 workers=-1)
+        missing = np.isinf(chords)
+        positions = np.where(missing, -1, positions)
+        distances = np.where(missing, np.inf, chord_to_nm(np.where(missing, 0, chords)))
+        return positions, distances
+
+    def within_radius(self, lats, lons, radius_nm):
+        """Return, per position, the row positions of the ports within radius_nm, nearest first (none for gaps)"""
+        vectors = unit_vectors(lats, lons)
+        finite = np.isfinite(vectors).all(axis=1)
+        matches = np.empty(len(vectors), dtype=object)
+        matches[:] = [[] for _ in range(len(vectors))]
+        if finite.any():
+            matches[finite] = self._tree.query_ball_point(vectors[finite], nm_to_chord(radius_nm) * (1 + 1e-9),
+                                                          workers=-1)
+        results = []
+        for vector, candidates in zip(vectors, matches):
+            candidates = np.asarray(candidates, dtype=int)
+            order = np.argsort(np.linalg.norm(self._tree.data[candidates] - vector, axis=1), kind='stable')
+            results.append(candidates[order])
+        return results
+
+    def nearest_port(self, lat, lon, max_distance_nm=None):
+        """Return the World Port Index row of the nearest port, with its distance_nm"""
+        positions, distances = self.nearest([lat], [lon], max_distance_nm)
+        if positions[0] < 0:
+            raise ValueError(f"No port within {max_distance_nm:g} NM of {lat:.4f}, {lon:.4f}")
+        port = self.ports.iloc[positions[0]].copy()
+        port['distance_nm'] = distances[0]
+        return port
+
+    def ports_within(self, lat, lon, radius_nm):
+        """Return the ports within radius_nm of a position, nearest first, with a distance_nm column"""
+        positions = self.within_radius([lat], [lon], radius_nm)[0]
+        ports = self.ports.iloc[positions].copy()
+        ports['distance_nm'] = chord_to_nm(np.linalg.norm(self._tree.data[positions] - unit_vectors([lat], [lon]),
+                                                          axis=1))
+        return ports
+
+
+def snap_positions(positions, spatial_index, lat_column='LATITUDE', lon_column='LONGITUDE', max_distance_nm=None):
+    """Add the nearest port (name, index number, distance in NM) to a DataFrame of positions"""
+    rows, distances = spatial_index.nearest(positions[lat_column], positions[lon_column], max_distance_nm)
+    ports = spatial_index.ports
+    found = rows >= 0
+    snapped = positions.copy()
+    snapped['port'] = pd.Series(ports['Main Port Name'].to_numpy(dtype=object)[np.where(found, rows, 0)],
+                                index=positions.index).where(found)
+    snapped['port_index_number'] = pd.Series(ports['World Port Index Number'].to_numpy()[np.where(found, rows, 0)],
+                                             index=positions.index).where(found).astype('Int64')
+    snapped['port_distance_nm'] = np.where(found, distances, np.nan)
+    return snapped
+
+
+def main():
+    from cii_core import load_world_ports
+
+    parser = argparse.ArgumentParser(description="Snap positions to their nearest port")
+    parser.add_argument("path", help="CSV file with latitude and longitude columns")
+    parser.add_argument("--lat-column", default="LATITUDE")
+    parser.add_argument("--lon-column", default="LONGITUDE")
+    parser.add_argument("--max-distance", type=float, help="Leave positions farther than this (NM) unsnapped")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--output", default="snapped_positions.csv")
+    args = parser.parse_args()
+
+    spatial_index = PortSpatialIndex(load_world_ports())
+    total = 0
+    for i, chunk in enumerate(pd.read_csv(args.path, chunksize=args.chunksize)):
+        snapped = snap_positions(chunk, spatial_index, args.lat_column, args.lon_column, args.max_distance)
+        snapped.to_csv(args.output, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        total += len(snapped)
+    print(f"Wrote {total} positions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+# CO2 conversion factors (t CO2 / t fuel) per fuel column of sf_consumption_logs
+FUEL_CO2_FACTORS = {
+    'HFO': 3.114,
+    'LFO': 3.151,
+    'GO_DO': 3.206,
+    'LNG': 2.75,
+    'LPG': 3.00,
+    'METHANOL': 1.375,
+    'ETHANOL': 1.913
+}
+
+
+# Columns returned by the vessel and fleet CII queries
+CII_RESULT_COLUMNS = ['Vessel', 'IMO', 'total_distance', 'CO2Emission', 'capacity', 'vessel_type',
+                      'Transportwork', 'Attained_AER']
+
+
+def co2_emission_sql():
+    """Return the SQL expression summing CO2 over all fuels, net of the FC_ columns"""
+    return " + \n        ".join(
+        f'COALESCE((SUM("FUEL_CONSUMPTION_{fuel}") - SUM("FC_FUEL_CONSUMPTION_{fuel}")) * {factor}, 0)'
+        for fuel, factor in FUEL_CO2_FACTORS.items()
+    )
+
+
+CII_COLUMNS_SQL = f"""
+        t1."VESSEL_NAME" AS "Vessel",
+        t1."VESSEL_IMO" AS "IMO",
+        SUM("DISTANCE_TRAVELLED_ACTUAL") AS "total_distance",
+        {co2_emission_sql()} AS "CO2Emission",
+        t2."deadweight" AS "capacity",
+        t2."vessel_type",
+        ROUND(CAST(SUM("DISTANCE_TRAVELLED_ACTUAL") * t2."deadweight" AS NUMERIC), 2) AS "Transportwork",
+        CASE
+            WHEN ROUND(CAST(SUM("DISTANCE_TRAVELLED_ACTUAL") * t2."deadweight" AS NUMERIC), 2) <> 0
+            THEN ROUND(CAST((
+        {co2_emission_sql()}
+            ) * 1000000 / (SUM("DISTANCE_TRAVELLED_ACTUAL") * t2."deadweight") AS NUMERIC), 2)
+            ELSE NULL
+        END AS "Attained_AER"
+"""
+
+VESSEL_DATA_QUERY = text(f"""
+    SELECT {CII_COLUMNS_SQL}
+    FROM
+        "sf_consumption_logs" AS t1
+    LEFT JOIN
+        "vessel_particulars" AS t2 ON t1."VESSEL_IMO" = t2."vessel_imo"
+    WHERE
+        t1."VESSEL_NAME" = :vessel_name
+        AND t1."REPORT_DATE" >= :start_date
+        AND t1."REPORT_DATE" < :end_date
+    GROUP BY
+        t1."VESSEL_NAME", t1."VESSEL_IMO", t2."deadweight", t2."vessel_type"
+""").execution_options(query_name='vessel_data')
+
+FLEET_DATA_QUERY = f"""
+    SELECT {CII_COLUMNS_SQL}
+    FROM
+        "sf_consumption_logs" AS t1
+    LEFT JOIN
+        "vessel_particulars" AS t2 ON t1."VESSEL_IMO" = t2."vessel_imo"
+    WHERE
+        t1."REPORT_DATE" >= :start_date
+        AND t1."REPORT_DATE" < :end_date
+        {{imo_filter}}
+    GROUP BY
+        t1."VESSEL_NAME", t1."VESSEL_IMO", t2."deadweight", t2."vessel_type"
+    ORDER BY
+        t1."VESSEL_NAME"
+"""
+
+
+def add_cii_columns(df):
+    """Add CO2Emission, Transportwork and Attained_AER to rows of per-fuel net consumption sums.
+
+    Expects total_distance, capacity and one lower-case column per fuel of
+    FUEL_CO2_FACTORS, and rounds like the SQL aggregation does.
+    """
+    df['CO2Emission'] = sum(df[fuel.lower()].fillna(0) * factor for fuel, factor in FUEL_CO2_FACTORS.items())
+    df['Transportwork'] = (df['total_distance'] * df['capacity']).round(2)
+    attained_aer = (df['CO2Emission'] * 1000000 / (df['total_distance'] * df['capacity'])).round(2)
+    df['Attained_AER'] = attained_aer.where(df['Transportwork'] != 0)
+    return df
+
+
+def year_bounds(year):
+    """Return the half-open [start, end) date range of a calendar year"""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def fetch_vessel_data(engine, vessel_name, year):
+    """Fetch one vessel's annual distance, CO2 and attained AER"""
+    start_date, end_date = year_bounds(year)
+    return pd.read_sql(VESSEL_DATA_QUERY, engine,
+                       params={'vessel_name': vessel_name, 'start_date': start_date, 'end_date': end_date})
+
+
+def fetch_fleet_data(engine, year, imos=None):
+    """Fetch annual distance, CO2 and attained AER of every vessel (or the given IMOs) in one query"""
+    start_date, end_date = year_bounds(year)
+    params = {'start_date': start_date, 'end_date': end_date}
+    if imos:
+        query = text(FLEET_DATA_QUERY.format(imo_filter='AND t1."VESSEL_IMO" IN :imos'))
+        query = query.bindparams(bindparam('imos', expanding=True))
+        params['imos'] = list(imos)
+    else:
+        query = text(FLEET_DATA_QUERY.format(imo_filter=''))
+    return pd.read_sql(query.execution_options(query_name='fleet_data'), engine, params=params)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from importlib import metadata
+
+import searoute as sr
+
+# Default location of the persistent route store
+ROUTE_CACHE_PATH = os.path.join(".cache", "route_cache.sqlite")
+
+
+def dataset_fingerprint(dataset_path):
+    """Return a short content hash of the port dataset"""
+    digest = hashlib.sha1()
+    with open(dataset_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def route_cache_version(dataset_path):
+    """Build the cache version key from the searoute release and the port dataset"""
+    try:
+        searoute_version = metadata.version('searoute')
+    except metadata.PackageNotFoundError:
+        searoute_version = 'unknown'
+    return f"searoute-{searoute_version}/ports-{dataset_fingerprint(dataset_path)}"
+
+
+def port_key(port):
+    """Return the cache key of a resolved World Port Index row"""
+    return int(port['World Port Index Number'])
+
+
+def port_coordinates(port):
+    """Return [lon, lat] of a resolved World Port Index row, as searoute expects"""
+    return [float(port['Longitude']), float(port['Latitude'])]
+
+
+def compute_route(origin_coords, destination_coords):
+    """Route between two [lon, lat] points and return length (NM) and geometry"""
+    sea_route = sr.searoute(origin_coords, destination_coords, units="naut")
+    return {
+        'length': float(sea_route['properties']['length']),
+        'coordinates': sea_route['geometry']['coordinates']
+    }
+
+
+class RouteCache:
+    """Two-tier cache of sea routes keyed by resolved port pair.
+
+    Lookups hit an in-process LRU first, then a SQLite store that survives
+    restarts. Persisted entries written under a different version key (another
+    searoute release or port dataset) are dropped when the cache is opened.
+    """
+
+    def __init__(self, path=ROUTE_CACHE_PATH, version='', memory_size=1024):
+        self.version = version
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS routes (
+                    version TEXT NOT NULL,
+                    origin INTEGER NOT NULL,
+                    destination INTEGER NOT NULL,
+                    length REAL NOT NULL,
+                    geometry TEXT NOT NULL,
+                    PRIMARY KEY (version, origin, destination)
+                )
+            """)
+            self._db.execute("DELETE FROM routes WHERE version <> ?", (version,))
+
+    def _remember(self, key, route):
+        self._memory[key] = route
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, origin_key, destination_key):
+        """Return a cached route or None"""
+        key = (origin_key, destination_key)
+        with self._lock:
+            route = self._memory.get(key)
+            if route is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return route
+
+            row = self._db.execute(
+                "SELECT length, geometry FROM routes WHERE version = ? AND origin = ? AND destination = ?",
+                (self.version, origin_key, destination_key)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            route = {'length': row[0], 'coordinates': json.loads(row[1])}
+            self._remember(key, route)
+            self.hits += 1
+            return route
+
+    def put(self, origin_key, destination_key, route):
+        """Store a route in both tiers"""
+        with self._lock, self._db:
+            self._remember((origin_key, destination_key), route)
+            self._db.execute(
+                "INSERT OR REPLACE INTO routes (version, origin, destination, length, geometry) VALUES (?, ?, ?, ?, ?)",
+                (self.version, origin_key, destination_key, route['length'], json.dumps(route['coordinates']))
+            )
+
+    def get_route(self, origin_port, destination_port):
+        """Return the sea route between two resolved ports, routing it on a miss"""
+        origin_key, destination_key = port_key(origin_port), port_key(destination_port)
+        route = self.get(origin_key, destination_key)
+        if route is None:
+            route = compute_route(port_coordinates(origin_port), port_coordinates(destination_port))
+            self.put(origin_key, destination_key, route)
+        return route
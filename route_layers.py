@@ -0,0 +1,138 @@
+import math
+
+import folium
+import numpy as np
+
+from tracing import count, span
+
+# Allowed deviation of a simplified route from the full geometry, in screen pixels
+PIXEL_TOLERANCE = 1.5
+
+# Map width the zoom level is fitted to, in pixels
+MAP_WIDTH = 800
+
+
+def simplify_line(coordinates, tolerance):
+    """Douglas-Peucker simplification of a [lon, lat] line; tolerance is in degrees"""
+    points = np.asarray(coordinates, dtype=float)
+    if len(points) < 3 or tolerance <= 0:
+        return points.tolist()
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        inner = points[first + 1:last] - start
+        length = math.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep].tolist()
+
+
+def fit_zoom(coordinates, width=MAP_WIDTH):
+    """Return the web-map zoom level at which [lat, lon] points fit the map width"""
+    points = np.asarray(coordinates, dtype=float)
+    extent = max(np.ptp(points[:, 0]) * 2, np.ptp(points[:, 1]), 1e-6)
+    return int(np.clip(math.floor(math.log2(360 * width / (256 * extent))), 1, 18))
+
+
+def zoom_tolerance(zoom, pixels=PIXEL_TOLERANCE):
+    """Return the simplification tolerance in degrees for a zoom level"""
+    return pixels * 360 / (256 * 2 ** zoom)
+
+
+def leg_feature(origin_port, destination_port, route_cache, tolerance):
+    """Return the simplified GeoJSON feature of one voyage leg"""
+    route = route_cache.get_route(origin_port, destination_port)
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': simplify_line(route['coordinates'], tolerance)},
+        'properties': {
+            'from_port': str(origin_port['Main Port Name']),
+            'to_port': str(destination_port['Main Port Name']),
+            'distance': round(float(route['length']))
+        }
+    }
+
+
+def build_route_layers(ports, port_index, route_cache, layer_cache, zoom=None):
+    """Return (port positions, leg features, errors) for a voyage, reusing cached legs.
+
+    layer_cache is a dict (kept in session state) of GeoJSON features keyed by
+    (origin, destination, tolerance); only legs whose port names changed are
+    routed and simplified again, and legs no longer in the voyage are dropped.
+    Without a zoom level, each leg uses the zoom that fits its two ports, which
+    is never coarser than the zoom fitting the whole voyage. Full-resolution
+    routes come from the route cache, so a new tolerance does not reroute.
+    """
+    positions = []
+    errors = []
+    with span('port_resolution', rows=len(ports)):
+        for port in ports:
+            try:
+                port_row = port_index.lookup(port)
+                positions.append((port, port_row, [float(port_row['Latitude']), float(port_row['Longitude'])]))
+            except Exception as e:
+                positions.append((port, None, None))
+                errors.append(f"Could not resolve port {port}: {e}")
+
+    features = []
+    keys = set()
+    for (origin, origin_row, origin_position), (destination, destination_row, destination_position) in \
+            zip(positions, positions[1:]):
+        if origin_row is None or destination_row is None:
+            continue
+        # Each leg is simplified for the zoom that fits its own ports, so editing
+        # another port of the voyage leaves this leg's key unchanged
+        leg_zoom = zoom if zoom is not None else fit_zoom([origin_position, destination_position])
+        tolerance = zoom_tolerance(leg_zoom)
+        key = (origin, destination, tolerance)
+        keys.add(key)
+        if key not in layer_cache:
+            try:
+                with span('routing', origin=origin, destination=destination):
+                    layer_cache[key] = leg_feature(origin_row, destination_row, route_cache, tolerance)
+            except Exception as e:
+                errors.append(f"Error plotting route for {origin} to {destination}: {e}")
+                continue
+            count('route_layers.built')
+        else:
+            count('route_layers.reused')
+        features.append(layer_cache[key])
+
+    for key in [key for key in layer_cache if key not in keys]:
+        del layer_cache[key]
+    return positions, features, errors
+
+
+def route_map(positions, features):
+    """Build a Folium map with port markers and all legs as a single GeoJSON layer"""
+    m = folium.Map(location=[0, 0], zoom_start=2)
+    located = [(name, position) for name, _, position in positions if position is not None]
+    for i, (name, position) in enumerate(located):
+        color = 'green' if i == 0 else 'red' if i == len(located) - 1 else 'blue'
+        folium.Marker(position, popup=name, icon=folium.Icon(color=color)).add_to(m)
+
+    if features:
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            style_function=lambda feature: {'color': 'red', 'weight': 2, 'opacity': 0.8},
+            tooltip=folium.GeoJsonTooltip(fields=['from_port', 'to_port', 'distance'],
+                                          aliases=['From', 'To', 'Distance (NM)'])
+        ).add_to(m)
+    if len(located) >= 2:
+        m.fit_bounds([position for _, position in located])
+    return m
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from cii_engine import RATINGS
+from voyage import EMISSION_FACTORS
+
+# Indicative bunker prices (USD/t) offered as defaults in the app
+DEFAULT_FUEL_PRICES = {
+    'VLSFO': 600.0,
+    'LSMGO': 800.0,
+    'LNG': 700.0
+}
+
+
+def sweep_projected_cii(voyage_calculations, current_data, rating_bounds, speeds, daily_consumptions,
+                        fuel_types, target_rating='C', reference_speed=None, fuel_prices=None):
+    """Evaluate projected AER and rating over a grid of voyage-wide speed, consumption and fuel.
+
+    voyage_calculations are the resolved legs (distance and port_time are used),
+    current_data holds total_distance, co2_emission and capacity, and
+    rating_bounds are the four A/B, B/C, C/D and D/E boundaries of the vessel.
+    With reference_speed, each daily consumption figure is taken at that speed
+    and scaled to the swept speed with the cubic propeller law.
+    fuel_prices maps fuel types to a price per tonne; cost is fuel used times
+    price, or plain fuel tonnage for fuels without a price.
+    Returns (scenarios, frontier, best): every scenario, the compliant scenarios
+    not beaten on both voyage days and cost, and the cheapest compliant one.
+    """
+    distance = float(sum(leg['distance'] for leg in voyage_calculations))
+    port_days = float(sum(leg['port_time'] for leg in voyage_calculations))
+    speeds = np.asarray(speeds, dtype=float)
+    daily_consumptions = np.asarray(daily_consumptions, dtype=float)
+    factors = np.array([EMISSION_FACTORS[fuel_type] for fuel_type in fuel_types])
+    prices = np.array([(fuel_prices or {}).get(fuel_type, 1.0) for fuel_type in fuel_types])
+
+    # Grid axes: speed x daily consumption x fuel type
+    speed = speeds[:, None, None]
+    daily = daily_consumptions[None, :, None]
+    if reference_speed:
+        daily = daily * (speed / reference_speed) ** 3
+    sea_days = distance / (speed * 24)
+    fuel_used = np.broadcast_to(daily * sea_days, (len(speeds), len(daily_consumptions), len(fuel_types)))
+    co2 = fuel_used * factors
+    cost = fuel_used * prices
+
+    total_distance = current_data.get('total_distance', 0) + distance
+    projected_aer = (current_data.get('co2_emission', 0) + co2) * 1000000 / (total_distance * current_data['capacity'])
+    rating_index = (projected_aer[..., None] > np.asarray(rating_bounds, dtype=float)).sum(axis=-1)
+    compliant = rating_index <= list(RATINGS).index(target_rating)
+
+    shape = projected_aer.shape
+    scenarios = pd.DataFrame({
+        'speed': np.broadcast_to(speed, shape).ravel(),
+        'daily_consumption': np.broadcast_to(daily, shape).ravel(),
+        'fuel_type': np.broadcast_to(np.array(fuel_types, dtype=object), shape).ravel(),
+        'sea_days': np.broadcast_to(sea_days, shape).ravel(),
+        'voyage_days': np.broadcast_to(sea_days + port_days, shape).ravel(),
+        'fuel_used': fuel_used.ravel(),
+        'co2_emissions': co2.ravel(),
+        'cost': cost.ravel(),
+        'projected_aer': projected_aer.ravel(),
+        'rating': RATINGS[rating_index.ravel()],
+        'compliant': compliant.ravel()
+    })
+
+    feasible = scenarios[scenarios['compliant']].sort_values(['voyage_days', 'cost'])
+    # Pareto frontier: each kept scenario is cheaper than every faster one
+    frontier = feasible[feasible['cost'] < feasible['cost'].cummin().shift(fill_value=np.inf)]
+    best = feasible.sort_values(['cost', 'voyage_days']).iloc[0].to_dict() if not feasible.empty else None
+    return scenarios, frontier.reset_index(drop=True), best
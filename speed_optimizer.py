@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from cii_engine import RATINGS
+from voyage import EMISSION_FACTORS
+
+BISECTION_STEPS = 100
+
+
+def target_aer_for_rating(rating_bounds, target_rating):
+    """Return the highest AER that still achieves the target rating"""
+    position = list(RATINGS).index(target_rating)
+    return float(rating_bounds[position]) if position < len(rating_bounds) else np.inf
+
+
+def _sea_times(weights, lower, upper, multipliers):
+    """Optimal sea times of legs costing weights / t**2 at the given marginal prices (rows)"""
+    multipliers = np.asarray(multipliers, dtype=float)[..., None]
+    with np.errstate(divide='ignore'):
+        times = np.where(multipliers > 0, np.cbrt(2 * weights / multipliers), np.inf)
+    return np.clip(times, lower, upper)
+
+
+def _block_multipliers(weights, lower, upper, block_ends, available):
+    """Smallest price per candidate block at which its legs fit into the available days.
+
+    Block b covers the legs up to block_ends[b]; all blocks are solved
+    together by bisection in log space.
+    """
+    weights, lower, upper = weights[None, :], lower[None, :], upper[None, :]
+    masks = np.arange(weights.shape[1])[None, :] <= np.asarray(block_ends)[:, None]
+    fits_slow = np.where(masks, upper, 0).sum(axis=1) <= available
+
+    low = np.full(len(available), 1e-12)
+    high = np.full(len(available), 1.0)
+    positive = weights > 0
+    if positive.any():
+        high[:] = max(1.0, float((2 * weights[positive] / lower[positive] ** 3).max()) * 10)
+    for _ in range(BISECTION_STEPS):
+        middle = np.sqrt(low * high)
+        total = np.where(masks, _sea_times(weights, lower, upper, middle), 0).sum(axis=1)
+        too_slow = total > available
+        low = np.where(too_slow, middle, low)
+        high = np.where(too_slow, high, middle)
+    return np.where(fits_slow, 0.0, high)
+
+
+def optimize_sea_times(weights, distances, port_days, min_speeds, max_speeds, deadlines):
+    """Minimize sum(weights / t**2) over sea times t subject to speed bounds and arrival deadlines.
+
+    deadlines[i] is the latest arrival day (from voyage start, port days
+    counted before sailing) at the end of leg i, or NaN. The problem is
+    convex; its KKT conditions give each leg t = cbrt(2 w / price), with the
+    price set by the tightest deadline ahead of the leg. Blocks of legs are
+    fixed from the most to the least constrained deadline.
+    """
+    n = len(weights)
+    lower = distances / (24 * max_speeds)
+    upper = distances / (24 * min_speeds)
+    times = upper.copy()
+
+    start, elapsed = 0, 0.0
+    while start < n:
+        ends = [end for end in range(start, n) if not np.isnan(deadlines[end])]
+        if not ends:
+            break
+        available = np.array([
+            deadlines[end] - elapsed - port_days[start:end + 1].sum() for end in ends
+        ])
+        block_lower = np.array([lower[start:end + 1].sum() for end in ends])
+        if (block_lower > available + 1e-9).any():
+            late = ends[int(np.argmax(block_lower > available + 1e-9))]
+            raise ValueError(f"The deadline of leg {late + 1} cannot be met at maximum speed")
+
+        span = slice(start, ends[-1] + 1)
+        prices = _block_multipliers(weights[span], lower[span], upper[span],
+                                    [end - start for end in ends], available)
+        critical = int(np.argmax(prices))
+        if prices[critical] <= 0:
+            break
+        end = ends[critical]
+        block = slice(start, end + 1)
+        times[block] = _sea_times(weights[block], lower[block], upper[block], prices[critical])
+        elapsed += port_days[block].sum() + times[block].sum()
+        start = end + 1
+    return times
+
+
+def optimize_voyage_speeds(voyage_calculations, current_data, target_aer, min_speed=8.0, max_speed=16.0,
+                           deadlines=None, objective='fuel'):
+    """Per-leg speeds that minimize voyage fuel (or CO2) while meeting the target AER and deadlines.
+
+    Each leg's daily consumption follows a cubic law k * v**3 calibrated from
+    the speed and consumption entered for it. The AER target is a CO2 budget
+    handled by a Lagrange multiplier found by bisection. min_speed, max_speed
+    and deadlines may be per-leg sequences.
+    Returns (legs, summary); summary['cii_met'] is False when no speeds within
+    the bounds and deadlines reach the target.
+    """
+    legs = pd.DataFrame(voyage_calculations)
+    n = len(legs)
+    distances = legs['distance'].to_numpy(dtype=float)
+    port_days = legs['port_time'].to_numpy(dtype=float)
+    factors = legs['fuel_type'].map(EMISSION_FACTORS).to_numpy(dtype=float)
+    k = legs['fuel_used'].to_numpy(dtype=float) / legs['speed'].to_numpy(dtype=float) ** 3
+    # Fuel on a leg sailed in t days at v = d / (24 t): k v**3 t = (k d**3 / 24**3) / t**2
+    fuel_weights = k * distances ** 3 / 24 ** 3
+    min_speeds = np.broadcast_to(np.asarray(min_speed, dtype=float), n)
+    max_speeds = np.broadcast_to(np.asarray(max_speed, dtype=float), n)
+    deadlines = np.full(n, np.nan) if deadlines is None else np.array(
+        [np.nan if deadline is None else deadline for deadline in deadlines], dtype=float)
+
+    base_weights = fuel_weights * (factors if objective == 'co2' else 1.0)
+    total_distance = current_data.get('total_distance', 0) + distances.sum()
+    co2_budget = target_aer * total_distance * current_data['capacity'] / 1000000 - current_data.get('co2_emission', 0)
+
+    def solve(multiplier):
+        times = optimize_sea_times(base_weights + multiplier * factors * fuel_weights,
+                                   distances, port_days, min_speeds, max_speeds, deadlines)
+        return times, float((factors * fuel_weights / times ** 2).sum())
+
+    multiplier = 0.0
+    times, co2 = solve(multiplier)
+    if co2 > co2_budget:
+        # Weighting CO2 ever more heavily converges to the minimum-CO2 plan
+        low, high = 0.0, 1e6
+        high_times, high_co2 = solve(high)
+        if high_co2 > co2_budget:
+            times, co2, multiplier = high_times, high_co2, high
+        else:
+            for _ in range(BISECTION_STEPS):
+                middle = (low + high) / 2
+                middle_times, middle_co2 = solve(middle)
+                if middle_co2 > co2_budget:
+                    low = middle
+                else:
+                    high, high_times, high_co2 = middle, middle_times, middle_co2
+            times, co2, multiplier = high_times, high_co2, high
+
+    speeds = distances / (24 * times)
+    fuel = fuel_weights / times ** 2
+    legs = pd.DataFrame({
+        'from_port': legs['from_port'],
+        'to_port': legs['to_port'],
+        'distance': distances,
+        'speed': speeds,
+        'sea_time': times,
+        'port_time': port_days,
+        'arrival_day': np.cumsum(port_days + times),
+        'daily_consumption': k * speeds ** 3,
+        'fuel_type': legs['fuel_type'],
+        'fuel_used': fuel,
+        'co2_emissions': fuel * factors
+    })
+    projected_aer = (current_data.get('co2_emission', 0) + co2) * 1000000 / (total_distance * current_data['capacity'])
+    summary = {
+        'total_fuel': float(fuel.sum()),
+        'total_co2': co2,
+        'projected_aer': float(projected_aer),
+        'target_aer': target_aer,
+        'cii_met': bool(co2 <= co2_budget + 1e-9),
+        'co2_multiplier': multiplier
+    }
+    return legs, summary
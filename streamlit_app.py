@@ -1,29 +1,19 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
-import urllib.parse
 from datetime import date, timedelta
 import folium
 from streamlit_folium import st_folium
-import searoute as sr
-from fuzzywuzzy import process
-
-# Database configuration
-DB_CONFIG = {
-    'host': 'aws-0-ap-south-1.pooler.supabase.com',
-    'database': 'postgres',
-    'user': 'postgres.conrxbcvuogbzfysomov',
-    'password': 'wXAryCC8@iwNvj#',
-    'port': '6543'
-}
-
-# Emission factors for different fuel types
-EMISSION_FACTORS = {
-    'VLSFO': 3.151,
-    'LSMGO': 3.206,
-    'LNG': 2.75
-}
+from cii_core import (CII_ENGINE, CIIError, current_cii, fleet_cii, get_db_engine, get_distance_matrix,
+                      get_leg_cache, get_port_index, get_route_cache)
+from voyage import EMISSION_FACTORS
+from scenario_sweep import DEFAULT_FUEL_PRICES, sweep_projected_cii
+from speed_optimizer import optimize_voyage_speeds, target_aer_for_rating
+from route_layers import build_route_layers, route_map
+from voyage_state import VoyageState
+from tracing import export_trace, span, trace
+from trajectory import OPERATING_PROFILES, REDUCTION_SCHEDULES, fleet_trajectories
+from voyage_reconstruction import vessel_legs
 
 # Streamlit page config
 st.set_page_config(page_title="CII Calculator", layout="wide", page_icon="🚢")
@@ -55,267 +45,27 @@ if 'port_table_data' not in st.session_state:
     st.session_state.port_table_data = []
 if 'voyage_calculations' not in st.session_state:
     st.session_state.voyage_calculations = []
+if 'route_layers' not in st.session_state:
+    st.session_state.route_layers = {}
+if 'voyage_state' not in st.session_state:
+    st.session_state.voyage_state = VoyageState()
+if 'projection_active' not in st.session_state:
+    st.session_state.projection_active = False
 
-# Vessel type mapping remains the same as in your original code
-VESSEL_TYPE_MAPPING = {
-    'ASPHALT/BITUMEN TANKER': 'tanker',
-    'BULK CARRIER': 'bulk_carrier',
-    'CEMENT CARRIER': 'bulk_carrier',
-    'CHEM/PROD TANKER': 'tanker',
-    'CHEMICAL TANKER': 'tanker',
-    'Chemical/Products Tanker': 'tanker',
-    'Combination Carrier': 'combination_carrier',
-    'CONTAINER': 'container_ship',
-    'Container Ship': 'container_ship',
-    'Container/Ro-Ro Ship': 'ro_ro_cargo_ship',
-    'Crude Oil Tanker': 'tanker',
-    'Gas Carrier': 'gas_carrier',
-    'General Cargo Ship': 'general_cargo_ship',
-    'LNG CARRIER': 'lng_carrier',
-    'LPG CARRIER': 'gas_carrier',
-    'LPG Tanker': 'gas_carrier',
-    'OIL TANKER': 'tanker',
-    'Products Tanker': 'tanker',
-    'Refrigerated Cargo Ship': 'refrigerated_cargo_carrier',
-    'Ro-Ro Ship': 'ro_ro_cargo_ship',
-    'Vehicle Carrier': 'ro_ro_cargo_ship_vc'
-}
-
-def get_db_engine():
-    """Create and return database engine"""
-    encoded_password = urllib.parse.quote(DB_CONFIG['password'])
-    db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{encoded_password}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-    return create_engine(db_url)
-
-# Your existing database query function remains the same
-def get_vessel_data(engine, vessel_name, year):
-    """Fetch vessel data from database"""
-    # Your existing query remains the same
-    query = text("""
-    SELECT 
-        t1."VESSEL_NAME" AS "Vessel",
-        t1."VESSEL_IMO" AS "IMO",
-        SUM("DISTANCE_TRAVELLED_ACTUAL") AS "total_distance",
-        COALESCE((SUM("FUEL_CONSUMPTION_HFO") - SUM("FC_FUEL_CONSUMPTION_HFO")) * 3.114, 0) + 
-        COALESCE((SUM("FUEL_CONSUMPTION_LFO") - SUM("FC_FUEL_CONSUMPTION_LFO")) * 3.151, 0) + 
-        COALESCE((SUM("FUEL_CONSUMPTION_GO_DO") - SUM("FC_FUEL_CONSUMPTION_GO_DO")) * 3.206, 0) + 
-        COALESCE((SUM("FUEL_CONSUMPTION_LNG") - SUM("FC_FUEL_CONSUMPTION_LNG")) * 2.75, 0) + 
-        COALESCE((SUM("FUEL_CONSUMPTION_LPG") - SUM("FC_FUEL_CONSUMPTION_LPG")) * 3.00, 0) + 
-        COALESCE((SUM("FUEL_CONSUMPTION_METHANOL") - SUM("FC_FUEL_CONSUMPTION_METHANOL")) * 1.375, 0) + 
-        COALESCE((SUM("FUEL_CONSUMPTION_ETHANOL") - SUM("FC_FUEL_CONSUMPTION_ETHANOL")) * 1.913, 0) AS "CO2Emission",
-        t2."deadweight" AS "capacity",
-        t2."vessel_type",
-        ROUND(CAST(SUM("DISTANCE_TRAVELLED_ACTUAL") * t2."deadweight" AS NUMERIC), 2) AS "Transportwork",
-        CASE 
-            WHEN ROUND(CAST(SUM("DISTANCE_TRAVELLED_ACTUAL") * t2."deadweight" AS NUMERIC), 2) <> 0 
-            THEN ROUND(CAST((
-                COALESCE((SUM("FUEL_CONSUMPTION_HFO") - SUM("FC_FUEL_CONSUMPTION_HFO")) * 3.114, 0) + 
-                COALESCE((SUM("FUEL_CONSUMPTION_LFO") - SUM("FC_FUEL_CONSUMPTION_LFO")) * 3.151, 0) + 
-                COALESCE((SUM("FUEL_CONSUMPTION_GO_DO") - SUM("FC_FUEL_CONSUMPTION_GO_DO")) * 3.206, 0) + 
-                COALESCE((SUM("FUEL_CONSUMPTION_LNG") - SUM("FC_FUEL_CONSUMPTION_LNG")) * 2.75, 0) + 
-                COALESCE((SUM("FUEL_CONSUMPTION_LPG") - SUM("FC_FUEL_CONSUMPTION_LPG")) * 3.00, 0) + 
-                COALESCE((SUM("FUEL_CONSUMPTION_METHANOL") - SUM("FC_FUEL_CONSUMPTION_METHANOL")) * 1.375, 0) + 
-                COALESCE((SUM("FUEL_CONSUMPTION_ETHANOL") - SUM("FC_FUEL_CONSUMPTION_ETHANOL")) * 1.913, 0)
-            ) * 1000000 / (SUM("DISTANCE_TRAVELLED_ACTUAL") * t2."deadweight") AS NUMERIC), 2)
-            ELSE NULL
-        END AS "Attained_AER"
-    FROM 
-        "sf_consumption_logs" AS t1
-    LEFT JOIN 
-        "vessel_particulars" AS t2 ON t1."VESSEL_IMO" = t2."vessel_imo"
-    WHERE 
-        t1."VESSEL_NAME" = :vessel_name
-        AND EXTRACT(YEAR FROM "REPORT_DATE") = :year
-    GROUP BY 
-        t1."VESSEL_NAME", t1."VESSEL_IMO", t2."deadweight", t2."vessel_type"
-    """)
-    
-    try:
-        return pd.read_sql(query, engine, params={'vessel_name': vessel_name, 'year': year})
-    except Exception as e:
-        st.error(f"Error executing SQL query: {str(e)}")
-        return pd.DataFrame()
-
-def calculate_reference_cii(capacity, ship_type):
-    """Calculate reference CII based on capacity and ship type"""
-    params = {
-        'bulk_carrier': [{'capacity_threshold': 279000, 'a': 4745, 'c': 0.622}],
-        'gas_carrier': [{'capacity_threshold': 65000, 'a': 144050000000, 'c': 2.071}],
-        'tanker': [{'capacity_threshold': float('inf'), 'a': 5247, 'c': 0.61}],
-        'container_ship': [{'capacity_threshold': float('inf'), 'a': 1984, 'c': 0.489}],
-        'general_cargo_ship': [{'capacity_threshold': float('inf'), 'a': 31948, 'c': 0.792}],
-        'refrigerated_cargo_carrier': [{'capacity_threshold': float('inf'), 'a': 4600, 'c': 0.557}],
-        'lng_carrier': [{'capacity_threshold': 100000, 'a': 144790000000000, 'c': 2.673}],
-    }
-    
-    ship_params = params.get(ship_type.lower())
-    if not ship_params:
-        raise ValueError(f"Unknown ship type: {ship_type}")
-    
-    a, c = ship_params[0]['a'], ship_params[0]['c']
-    return a * (capacity ** -c)
-
-def calculate_required_cii(reference_cii, year):
-    """Calculate required CII based on reference CII and year"""
-    reduction_factors = {2023: 0.95, 2024: 0.93, 2025: 0.91, 2026: 0.89}
-    return reference_cii * reduction_factors.get(year, 1.0)
-
-def calculate_cii_rating(attained_cii, required_cii):
-    """Calculate CII rating based on attained and required CII"""
-    if attained_cii <= required_cii:
-        return 'A'
-    elif attained_cii <= 1.05 * required_cii:
-        return 'B'
-    elif attained_cii <= 1.1 * required_cii:
-        return 'C'
-    elif attained_cii <= 1.15 * required_cii:
-        return 'D'
-    else:
-        return 'E'
-
-@st.cache_data
-def load_world_ports():
-    """Load and cache world ports data"""
-    return pd.read_csv("UpdatedPub150.csv")
-
-def calculate_segment_metrics(row, world_ports_data):
-    """Calculate metrics for a single voyage segment"""
-    if not all([row[0], row[1], row[2], row[3], row[4], row[5]]):  # Check if all required fields are filled
-        return None
-    
-    try:
-        # Calculate distance
-        distance = route_distance(row[0], row[1], world_ports_data)
-        
-        # Calculate time at sea (days)
-        sea_time = distance / (row[3] * 24)  # speed in knots
-        
-        # Total segment time (sea time + port time)
-        total_time = sea_time + row[2]  # port days
-        
-        # Calculate CO2 emissions based on fuel type
-        co2_emissions = row[4] * sea_time * EMISSION_FACTORS[row[5]]  # fuel used * emission factor
-        
-        return {
-            'from_port': row[0],
-            'to_port': row[1],
-            'distance': distance,
-            'sea_time': sea_time,
-            'port_time': row[2],
-            'total_time': total_time,
-            'speed': row[3],
-            'fuel_used': row[4],
-            'fuel_type': row[5],
-            'co2_emissions': co2_emissions
-        }
-    except Exception as e:
-        st.error(f"Error calculating segment metrics: {str(e)}")
-        return None
-
-def route_distance(origin, destination, world_ports_data):
-    """Calculate route distance between two ports"""
-    try:
-        origin_port = world_port_index(origin, world_ports_data)
-        destination_port = world_port_index(destination, world_ports_data)
-        origin_coords = [float(origin_port['Longitude']), float(origin_port['Latitude'])]
-        destination_coords = [float(destination_port['Longitude']), float(destination_port['Latitude'])]
-        sea_route = sr.searoute(origin_coords, destination_coords, units="naut")
-        return int(sea_route['properties']['length'])
-    except Exception as e:
-        st.error(f"Error calculating distance between {origin} and {destination}: {str(e)}")
-        return 0
-
-def world_port_index(port_to_match, world_ports_data):
-    """Find best matching port from world ports data"""
-    best_match = process.extractOne(port_to_match, world_ports_data['Main Port Name'])
-    return world_ports_data[world_ports_data['Main Port Name'] == best_match[0]].iloc[0]
-
-def plot_route(ports, world_ports_data):
-    """Plot route on a Folium map"""
-    m = folium.Map(location=[0, 0], zoom_start=2)
-    
-    if len(ports) >= 2 and all(ports):
-        coordinates = []
-        for i in range(len(ports) - 1):
-            try:
-                start_port = world_port_index(ports[i], world_ports_data)
-                end_port = world_port_index(ports[i+1], world_ports_data)
-                start_coords = [float(start_port['Latitude']), float(start_port['Longitude'])]
-                end_coords = [float(end_port['Latitude']), float(end_port['Longitude'])]
-                
-                # Add markers for ports
-                folium.Marker(
-                    start_coords,
-                    popup=ports[i],
-                    icon=folium.Icon(color='green' if i == 0 else 'blue')
-                ).add_to(m)
-                
-                if i == len(ports) - 2:
-                    folium.Marker(
-                        end_coords,
-                        popup=ports[i+1],
-                        icon=folium.Icon(color='red')
-                    ).add_to(m)
-                
-                # Draw route line
-                route = sr.searoute(start_coords[::-1], end_coords[::-1])
-                folium.PolyLine(
-                    locations=[list(reversed(coord)) for coord in route['geometry']['coordinates']], 
-                    color="red",
-                    weight=2,
-                    opacity=0.8
-                ).add_to(m)
-                
-                coordinates.extend([start_coords, end_coords])
-            except Exception as e:
-                st.error(f"Error plotting route for {ports[i]} to {ports[i+1]}: {str(e)}")
-        
-        if coordinates:
-            m.fit_bounds(coordinates)
-    
-    return m
-
-def calculate_projected_cii(current_data, voyage_calculations):
-    """Calculate projected CII based on current data and planned voyage"""
-    if not voyage_calculations:
-        return None
-    
-    try:
-        # Sum up new voyage metrics
-        total_new_distance = sum(seg['distance'] for seg in voyage_calculations)
-        total_new_co2 = sum(seg['co2_emissions'] for seg in voyage_calculations)
-        
-        # Get current annual values
-        current_distance = current_data.get('total_distance', 0)
-        current_co2 = current_data.get('co2_emission', 0)
-        capacity = current_data.get('capacity', 0)
-        
-        if capacity <= 0:
-            raise ValueError("Invalid vessel capacity")
-            
-        # Calculate combined metrics
-        total_distance = current_distance + total_new_distance
-        total_co2 = current_co2 + total_new_co2
-        
-        # Calculate projected AER
-        projected_aer = (total_co2 * 1000000) / (total_distance * capacity)
-        
-        return {
-            'projected_aer': projected_aer,
-            'new_distance': total_new_distance,
-            'new_co2': total_new_co2,
-            'total_distance': total_distance,
-            'total_co2': total_co2
-        }
-    except Exception as e:
-        st.error(f"Error calculating projected CII: {str(e)}")
-        return None
+def plot_route(ports, port_index):
+    """Plot route on a Folium map, reusing the cached layers of unchanged legs"""
+    positions, features, errors = build_route_layers(
+        ports, port_index, get_route_cache(), st.session_state.route_layers
+    )
+    for error in errors:
+        st.error(error)
+    return route_map(positions, features)
 
 def main():
     st.title('🚢 CII Calculator')
 
     # Load world ports data
-    world_ports_data = load_world_ports()
+    port_index = get_port_index()
 
     # User inputs for vessel and year
     col1, col2, col3 = st.columns(3)
@@ -332,37 +82,10 @@ def main():
 
     # Calculate current CII
     if calculate_clicked and vessel_name:
-        engine = get_db_engine()
-        df = get_vessel_data(engine, vessel_name, year)
-        
-        if not df.empty:
-            vessel_type = df['vessel_type'].iloc[0]
-            imo_ship_type = VESSEL_TYPE_MAPPING.get(vessel_type)
-            capacity = df['capacity'].iloc[0]
-            attained_aer = df['Attained_AER'].iloc[0]
-
-            if imo_ship_type and attained_aer is not None:
-                reference_cii = calculate_reference_cii(capacity, imo_ship_type)
-                required_cii = calculate_required_cii(reference_cii, year)
-                cii_rating = calculate_cii_rating(attained_aer, required_cii)
-                
-                st.session_state.cii_data = {
-                    'attained_aer': attained_aer,
-                    'required_cii': required_cii,
-                    'cii_rating': cii_rating,
-                    'total_distance': df['total_distance'].iloc[0],
-                    'co2_emission': df['CO2Emission'].iloc[0],
-                    'capacity': capacity,
-                    'vessel_type': vessel_type,
-                    'imo_ship_type': imo_ship_type
-                }
-            else:
-                if imo_ship_type is None:
-                    st.error(f"The vessel type '{vessel_type}' is not supported for CII calculations.")
-                if attained_aer is None:
-                    st.error("Unable to calculate Attained AER. Please check the vessel's data.")
-        else:
-            st.error(f"No data found for vessel {vessel_name} in year {year}")
+        try:
+            st.session_state.cii_data = current_cii(get_db_engine(), vessel_name, year)
+        except CIIError as e:
+            st.error(str(e))
 
     # Display current CII results if available
     if st.session_state.cii_data:
@@ -384,6 +107,25 @@ def main():
             st.metric('CO2 Emission (MT)', 
                      f"{st.session_state.cii_data['co2_emission']:,.1f}")
 
+        with st.expander("Voyage History"):
+            if st.button('Reconstruct Voyage Legs') and vessel_name:
+                with span('voyage_history'):
+                    legs = vessel_legs(get_db_engine(), get_leg_cache(), vessel_name, year, port_index.spatial)
+                if legs.empty:
+                    st.info("No reports found for this vessel and year.")
+                else:
+                    sea_legs = legs[legs['phase'] == 'sea']
+                    st.markdown(f"{len(sea_legs)} sea passages and {len(legs) - len(sea_legs)} port stays")
+                    st.markdown("#### Largest AER Contributions")
+                    st.dataframe(legs.nlargest(5, 'aer_contribution'))
+                    st.dataframe(legs)
+                    st.download_button(
+                        "Download Voyage Legs",
+                        legs.to_csv(index=False),
+                        file_name=f"voyage_legs_{vessel_name}_{year}.csv",
+                        mime="text/csv"
+                    )
+
     # Voyage Planning Section - Always visible
     st.markdown("### Voyage Planning")
     
@@ -409,12 +151,12 @@ def main():
             column_config={
                 "From Port": st.column_config.TextColumn(
                     "From Port",
-                    help="Enter departure port name",
+                    help="Enter departure port name or position (lat, lon)",
                     required=True
                 ),
                 "To Port": st.column_config.TextColumn(
                     "To Port",
-                    help="Enter arrival port name",
+                    help="Enter arrival port name or position (lat, lon)",
                     required=True
                 ),
                 "Port Days": st.column_config.NumberColumn(
@@ -453,37 +195,44 @@ def main():
         st.session_state.port_table_data = edited_df.values.tolist()
 
     # Map display
-    with right_col:
+    with right_col, span('map.render'):
         if len(st.session_state.port_table_data) >= 1:
             ports = [row[0] for row in st.session_state.port_table_data if row[0]]
             if st.session_state.port_table_data[-1][1]:  # Add last destination
                 ports.append(st.session_state.port_table_data[-1][1])
             
             if len(ports) >= 2:
-                m = plot_route(ports, world_ports_data)
+                m = plot_route(ports, port_index)
             else:
                 m = folium.Map(location=[0, 0], zoom_start=2)
         else:
             m = folium.Map(location=[0, 0], zoom_start=2)
         
-        st_folium(m, width=None, height=400)
+        st_folium(m, width=None, height=400, returned_objects=[])
 
     # Calculate projected CII button - disabled if no current CII data
     if st.button('Calculate Projected CII', 
                  disabled=not bool(st.session_state.cii_data),
                  help="Current CII calculation required before projecting future CII"):
+        st.session_state.projection_active = True
+
+    # Once requested, the projection follows table edits, recomputing only the changed rows
+    if st.session_state.cii_data and st.session_state.projection_active:
         if len(st.session_state.port_table_data) >= 1:
-            # Calculate metrics for each voyage segment
-            voyage_calculations = []
-            for row in st.session_state.port_table_data:
-                segment_metrics = calculate_segment_metrics(row, world_ports_data)
-                if segment_metrics:
-                    voyage_calculations.append(segment_metrics)
-            
+            voyage_state = st.session_state.voyage_state
+            voyage_state.update(st.session_state.port_table_data, port_index, get_route_cache(),
+                                get_distance_matrix())
+            for error in voyage_state.errors():
+                st.error(error)
+            voyage_calculations = voyage_state.segments()
+            try:
+                projections = voyage_state.projection(st.session_state.cii_data)
+            except CIIError as e:
+                st.error(str(e))
+                projections = None
+
+            st.session_state.voyage_calculations = voyage_calculations
             if voyage_calculations:
-                # Calculate projected CII
-                projections = calculate_projected_cii(st.session_state.cii_data, voyage_calculations)
-                
                 if projections:
                     # Display segment calculations
                     st.markdown("#### Voyage Segment Calculations")
@@ -498,11 +247,7 @@ def main():
                                 f"{projections['projected_aer']:.4f}", 
                                 f"{projections['projected_aer'] - st.session_state.cii_data['attained_aer']:.4f}")
                     with col2:
-                        projected_rating = calculate_cii_rating(
-                            projections['projected_aer'], 
-                            st.session_state.cii_data['required_cii']
-                        )
-                        st.metric("Projected CII Rating", projected_rating)
+                        st.metric("Projected CII Rating", projections['projected_rating'])
                     with col3:
                         st.metric("Additional CO2 (MT)", 
                                 f"{projections['new_co2']:,.1f}")
@@ -521,5 +266,194 @@ def main():
         else:
             st.warning("Please add at least one voyage segment to calculate projections.")
 
+    # Scenario sweep over speed, consumption and fuel for the calculated voyage
+    if st.session_state.cii_data and st.session_state.voyage_calculations:
+        with st.expander("Scenario Sweep"):
+            voyage_calculations = st.session_state.voyage_calculations
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                speed_range = st.slider("Speed range (knots)", 5.0, 25.0, (8.0, 16.0), step=0.5)
+                speed_step = st.number_input("Speed step (knots)", min_value=0.1, max_value=5.0, value=0.5, step=0.1)
+            with col2:
+                consumption_text = st.text_input("Daily consumption figures (mT/d, comma separated)",
+                                                 value="20, 30, 40, 50")
+                reference_speed = st.number_input(
+                    "Speed the figures apply at (knots, 0 = independent of speed)", min_value=0.0, max_value=30.0,
+                    value=float(np.mean([leg['speed'] for leg in voyage_calculations]))
+                )
+            with col3:
+                sweep_fuels = st.multiselect("Fuel types", list(EMISSION_FACTORS.keys()),
+                                             default=list(EMISSION_FACTORS.keys()))
+                target_rating = st.selectbox("Target rating", ['A', 'B', 'C', 'D'], index=2)
+
+            fuel_prices = {}
+            if sweep_fuels:
+                price_cols = st.columns(len(sweep_fuels))
+                for price_col, fuel_type in zip(price_cols, sweep_fuels):
+                    with price_col:
+                        fuel_prices[fuel_type] = st.number_input(
+                            f"{fuel_type} price (USD/t)", min_value=0.0,
+                            value=DEFAULT_FUEL_PRICES.get(fuel_type, 0.0), step=10.0
+                        )
+
+            if st.button('Run Scenario Sweep'):
+                try:
+                    consumptions = [float(value) for value in consumption_text.split(',') if value.strip()]
+                except ValueError:
+                    consumptions = []
+                if not consumptions or not sweep_fuels:
+                    st.warning("Enter at least one consumption figure and one fuel type.")
+                else:
+                    scenarios, frontier, best = sweep_projected_cii(
+                        voyage_calculations,
+                        st.session_state.cii_data,
+                        CII_ENGINE.rating_bounds(st.session_state.cii_data['required_cii'])[0],
+                        np.arange(speed_range[0], speed_range[1] + speed_step / 2, speed_step),
+                        consumptions,
+                        sweep_fuels,
+                        target_rating=target_rating,
+                        reference_speed=reference_speed or None,
+                        fuel_prices=fuel_prices
+                    )
+                    st.write(f"{int(scenarios['compliant'].sum())} of {len(scenarios)} scenarios reach {target_rating} or better")
+                    if best is None:
+                        st.warning(f"No scenario reaches rating {target_rating}.")
+                    else:
+                        st.markdown("#### Cheapest Compliant Scenario")
+                        st.dataframe(pd.DataFrame([best]))
+                        st.markdown("#### Feasible Frontier (voyage days vs fuel cost, USD)")
+                        st.dataframe(frontier)
+
+        with st.expander("Speed Optimization"):
+            voyage_calculations = st.session_state.voyage_calculations
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                optimization_speeds = st.slider("Allowed speed (knots)", 5.0, 25.0, (8.0, 16.0), step=0.5,
+                                                key='optimization_speeds')
+            with col2:
+                arrival_deadline = st.number_input("Arrive within (days, 0 = no deadline)", min_value=0.0, value=0.0)
+                objective = st.radio("Minimize", ['fuel', 'co2'], format_func=str.upper, horizontal=True)
+            with col3:
+                optimization_rating = st.selectbox("Target rating", ['A', 'B', 'C', 'D'], index=2,
+                                                   key='optimization_rating')
+
+            if st.button('Optimize Speeds'):
+                target_aer = target_aer_for_rating(
+                    CII_ENGINE.rating_bounds(st.session_state.cii_data['required_cii'])[0], optimization_rating
+                )
+                deadlines = [None] * (len(voyage_calculations) - 1) + [arrival_deadline or None]
+                try:
+                    optimized_legs, summary = optimize_voyage_speeds(
+                        voyage_calculations,
+                        st.session_state.cii_data,
+                        target_aer,
+                        min_speed=optimization_speeds[0],
+                        max_speed=optimization_speeds[1],
+                        deadlines=deadlines,
+                        objective=objective
+                    )
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    if not summary['cii_met']:
+                        st.warning(f"Rating {optimization_rating} cannot be reached within the speed limits "
+                                   f"and deadline; showing the lowest-CO2 plan.")
+                    st.dataframe(optimized_legs)
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Total Fuel (MT)", f"{summary['total_fuel']:,.1f}")
+                    with col2:
+                        st.metric("Total CO2 (MT)", f"{summary['total_co2']:,.1f}")
+                    with col3:
+                        st.metric("Projected AER", f"{summary['projected_aer']:.4f}",
+                                  f"{summary['projected_aer'] - target_aer:.4f}", delta_color="inverse")
+
+    # Fleet-wide CII report
+    st.markdown("### Fleet CII Report")
+    fleet_col1, fleet_col2 = st.columns([3, 1])
+    with fleet_col1:
+        fleet_imos = st.text_input("IMO Numbers (comma separated, leave empty for the whole fleet)")
+    with fleet_col2:
+        fleet_clicked = st.button('Calculate Fleet CII')
+
+    if fleet_clicked:
+        try:
+            imos = [int(imo) for imo in fleet_imos.replace(';', ',').split(',') if imo.strip()]
+        except ValueError:
+            st.error("IMO numbers must be numeric")
+            imos = None
+        if imos is not None:
+            try:
+                st.session_state.fleet_cii = fleet_cii(get_db_engine(), year, imos)
+            except CIIError as e:
+                st.error(str(e))
+
+    if 'fleet_cii' in st.session_state:
+        fleet_report = st.session_state.fleet_cii
+        st.dataframe(fleet_report)
+        st.download_button(
+            "Download Fleet CII Report",
+            fleet_report.to_csv(index=False),
+            file_name=f"fleet_cii_{year}.csv",
+            mime="text/csv"
+        )
+
+        with st.expander("Fleet CII Trajectory"):
+            trajectory_col1, trajectory_col2 = st.columns(2)
+            with trajectory_col1:
+                schedule_name = st.selectbox("Reduction factor schedule", list(REDUCTION_SCHEDULES),
+                                             index=list(REDUCTION_SCHEDULES).index('imo_2023_2030'))
+            with trajectory_col2:
+                profile_names = st.multiselect("Operating profiles", list(OPERATING_PROFILES),
+                                               default=list(OPERATING_PROFILES))
+            schedule = REDUCTION_SCHEDULES[schedule_name]
+            projection_years = [projection_year for projection_year in sorted(schedule) if projection_year >= year]
+
+            if st.button('Project Fleet Trajectory') and profile_names:
+                trajectory, flags = fleet_trajectories(
+                    fleet_report, year, projection_years,
+                    profiles={name: OPERATING_PROFILES[name] for name in profile_names},
+                    schedule=schedule, engine=CII_ENGINE
+                )
+                if flags.empty:
+                    st.success("No vessel is heading for three consecutive D ratings or an E rating.")
+                else:
+                    st.warning(f"{flags['IMO'].nunique()} vessels are heading for three consecutive D ratings "
+                               f"or an E rating under at least one profile.")
+                    st.dataframe(flags)
+                st.dataframe(trajectory.pivot(index=['Vessel', 'profile'], columns='year', values='rating'))
+                st.download_button(
+                    "Download Fleet CII Trajectory",
+                    trajectory.to_csv(index=False),
+                    file_name=f"fleet_cii_trajectory_{year}.csv",
+                    mime="text/csv"
+                )
+
+def show_trace_panel(rerun_trace):
+    """Show where the time of the last rerun went"""
+    with st.sidebar.expander("Performance Trace", expanded=True):
+        st.metric("Rerun (ms)", f"{rerun_trace.root.duration_ms:,.1f}")
+        stages = rerun_trace.stage_summary()
+        if stages:
+            st.dataframe(pd.DataFrame(stages).round(2), hide_index=True)
+        caches = rerun_trace.cache_summary()
+        if caches:
+            st.dataframe(pd.DataFrame(caches).round(3), hide_index=True)
+        if rerun_trace.counters:
+            st.json(dict(rerun_trace.counters))
+
+def run():
+    """Render the app inside a per-rerun trace"""
+    show_panel = st.sidebar.checkbox("Show performance trace")
+    with trace('streamlit.rerun') as rerun_trace:
+        port_index = get_port_index()
+        route_cache = get_route_cache()
+        rerun_trace.watch_cache('port_index', lambda: port_index.lookup_position.cache_info()[:2])
+        rerun_trace.watch_cache('route_cache', lambda: (route_cache.hits, route_cache.misses))
+        main()
+    export_trace(rerun_trace)
+    if show_panel:
+        show_trace_panel(rerun_trace)
+
 if __name__ == '__main__':
-    main()
+    run()
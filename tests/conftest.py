@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_data import create_synthetic_database  # noqa: E402
+
+YEAR = 2024
+
+
+@pytest.fixture
+def report_engine(tmp_path):
+    """Synthetic fleet where some fuel columns have no readings for a whole vessel-year.
+
+    BENCH-0002 never reports FC_FUEL_CONSUMPTION_GO_DO and BENCH-0003 never
+    reports FUEL_CONSUMPTION_LFO, so the CII queries count no CO2 for those
+    fuels; BENCH-0001 has scattered missing readings.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'reports.sqlite'}")
+    create_synthetic_database(str(engine.url), vessels=3, years=(YEAR,))
+    with engine.begin() as conn:
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FC_FUEL_CONSUMPTION_GO_DO" = NULL '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0002\''))
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FUEL_CONSUMPTION_LFO" = NULL '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0003\''))
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FC_FUEL_CONSUMPTION_HFO" = NULL, '
+                          '"DISTANCE_TRAVELLED_ACTUAL" = NULL '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0001\' AND strftime(\'%d\', "REPORT_DATE") = \'15\''))
+    return engine
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from aggregates import (create_aggregate_tables, create_report_date_index, fetch_aggregated_vessel_data,
+                        new_rows_query, refresh_aggregates)
+from benchmarks.synthetic_data import vessel_name
+from queries import fetch_vessel_data
+from tests.conftest import YEAR
+
+
+RENAMED = 'BENCH-0001 RENAMED'
+
+
+def assert_matches_vessel_query(engine, name):
+    expected = fetch_vessel_data(engine, name, YEAR)
+    actual = fetch_aggregated_vessel_data(engine, name, YEAR)
+    assert not expected.empty
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+@pytest.mark.parametrize('name', [vessel_name(1), vessel_name(2), vessel_name(3), RENAMED])
+def test_aggregates_match_vessel_query(report_engine, name):
+    with report_engine.begin() as conn:
+        create_aggregate_tables(conn)
+        # BENCH-0001 is renamed partway through June
+        conn.execute(text(f'UPDATE "sf_consumption_logs" SET "VESSEL_NAME" = \'{RENAMED}\' '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0001\' AND "REPORT_DATE" >= \'2024-06-15\''))
+    refresh_aggregates(report_engine)
+    assert_matches_vessel_query(report_engine, name)
+
+
+def test_refresh_takes_in_late_and_corrected_reports(report_engine):
+    december = 'WHERE "VESSEL_NAME" = \'BENCH-0002\' AND "REPORT_DATE" >= \'2024-12-01\''
+    # A report dated before the high-water mark that is only ingested later
+    backfilled = ('WHERE "VESSEL_NAME" = \'BENCH-0002\' '
+                  'AND "REPORT_DATE" >= \'2024-11-29\' AND "REPORT_DATE" < \'2024-11-30\'')
+    with report_engine.begin() as conn:
+        create_aggregate_tables(conn)
+        conn.execute(text(f'CREATE TABLE late_reports AS SELECT * FROM "sf_consumption_logs" {december}'))
+        conn.execute(text(f'DELETE FROM "sf_consumption_logs" {december}'))
+        conn.execute(text(f'CREATE TABLE backfilled AS SELECT * FROM "sf_consumption_logs" {backfilled}'))
+        conn.execute(text(f'DELETE FROM "sf_consumption_logs" {backfilled}'))
+    refresh_aggregates(report_engine)
+
+    with report_engine.begin() as conn:
+        conn.execute(text('INSERT INTO "sf_consumption_logs" SELECT * FROM backfilled'))
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FUEL_CONSUMPTION_HFO" = 2 * "FUEL_CONSUMPTION_HFO" '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0002\' AND "REPORT_DATE" >= \'2024-11-28\''))
+    refresh_aggregates(report_engine)
+    assert_matches_vessel_query(report_engine, vessel_name(2))
+
+    with report_engine.begin() as conn:
+        conn.execute(text('INSERT INTO "sf_consumption_logs" SELECT * FROM late_reports'))
+    refresh_aggregates(report_engine)
+    assert_matches_vessel_query(report_engine, vessel_name(2))
+
+
+def test_new_rows_are_unique_per_aggregate_key(report_engine):
+    with report_engine.begin() as conn:
+        create_aggregate_tables(conn)
+        conn.execute(text(f'UPDATE "sf_consumption_logs" SET "VESSEL_NAME" = \'{RENAMED}\' '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0001\' AND strftime(\'%d\', "REPORT_DATE") > \'20\''))
+        new_rows = pd.read_sql(new_rows_query(report_engine.dialect.name), conn)
+    # PostgreSQL rejects an upsert batch that hits the same conflict key twice
+    assert not new_rows.duplicated(['vessel_imo', 'vessel_name', 'period_year', 'period_month']).any()
+
+
+def test_vessel_query_uses_name_index(report_engine):
+    with report_engine.begin() as conn:
+        create_report_date_index(conn)
+        plan = conn.execute(text('EXPLAIN QUERY PLAN SELECT * FROM "sf_consumption_logs" '
+                                 'WHERE "VESSEL_NAME" = :name AND "REPORT_DATE" >= :start AND "REPORT_DATE" < :end'),
+                            {'name': 'BENCH-0001', 'start': '2024-01-01', 'end': '2025-01-01'}).fetchall()
+    assert any('sf_consumption_logs_name_report_date' in row[-1] for row in plan)
@@ -0,0 +1,32 @@
+import asyncio
+import json
+
+import pytest
+
+import cii_api
+from cii_core import CIIError, calculate_projected_cii
+
+
+def request(method, path, body):
+    messages = []
+
+    async def receive():
+        return {'body': json.dumps(body).encode()}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(cii_api.app({'type': 'http', 'method': method, 'path': path, 'query_string': b''}, receive, send))
+    return messages[0]['status'], json.loads(messages[1]['body'])
+
+
+def test_projection_rejects_zero_total_distance():
+    current = {'total_distance': 0.0, 'co2_emission': 0.0, 'capacity': 50000.0, 'required_cii': 5.0}
+    with pytest.raises(CIIError):
+        calculate_projected_cii(current, [{'distance': 0, 'co2_emissions': 0.0}])
+
+
+def test_fleet_requires_a_list_of_imos():
+    status, payload = request('POST', '/cii/fleet', {'year': 2024, 'imos': '123'})
+    assert status == 400
+    assert 'list' in payload['error']
@@ -0,0 +1,71 @@
+import os
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+
+import numpy as np
+import pytest
+
+import cii_core
+from cii_engine import CIIEngine, DD_VECTORS, REDUCTION_FACTORS, REFERENCE_CII_PARAMS
+
+CASES = 20000
+
+# Tier thresholds of the parameter tables, where the first-match lookups switch rows
+BOUNDARY_CAPACITIES = [20000, 65000, 100000, 279000, 297000]
+
+YEARS = [2022, 2023, 2024, 2025, 2026, 2027]
+
+
+@pytest.fixture(scope='module')
+def ciicalculator():
+    # The dd-vector calculator is a script without a .py suffix
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ciicalculator')
+    loader = SourceFileLoader('ciicalculator', path)
+    module = module_from_spec(spec_from_loader('ciicalculator', loader))
+    loader.exec_module(module)
+    return module
+
+
+def random_cases(ship_types, seed):
+    rng = np.random.default_rng(seed)
+    capacities = np.where(rng.random(CASES) < 0.2, rng.choice(BOUNDARY_CAPACITIES, CASES),
+                          np.round(rng.uniform(1000, 450000, CASES)))
+    types = rng.choice(ship_types, CASES)
+    years = rng.choice(YEARS, CASES)
+    # Attained CII spread across all five rating bands
+    attained = rng.uniform(0.5, 80, CASES)
+    return capacities, types, years, attained
+
+
+def test_tiered_engine_matches_dd_vector_calculator(ciicalculator):
+    capacities, types, years, attained = random_cases(sorted(REFERENCE_CII_PARAMS), seed=1)
+    engine = CIIEngine(REFERENCE_CII_PARAMS, DD_VECTORS, REDUCTION_FACTORS)
+    results = engine.evaluate(capacities, types, years, attained)
+
+    for i, (capacity, ship_type, year, attained_cii) in enumerate(zip(capacities, types, years, attained)):
+        try:
+            reference = ciicalculator.calculate_reference_cii(capacity, ship_type)
+        except ValueError:
+            assert np.isnan(results['reference_cii'][i])
+            assert results['rating'][i] is None
+            continue
+        required = ciicalculator.calculate_required_cii(reference, year)
+        assert results['reference_cii'][i] == pytest.approx(reference, rel=1e-12)
+        assert results['required_cii'][i] == pytest.approx(required, rel=1e-12)
+        try:
+            rating = ciicalculator.calculate_cii_rating(attained_cii, required, ship_type, capacity)
+        except ValueError:
+            rating = None
+        assert results['rating'][i] == rating, (capacity, ship_type, year, attained_cii)
+
+
+def test_simplified_engine_matches_scalar_functions():
+    capacities, types, years, attained = random_cases(sorted(cii_core.REFERENCE_CII_PARAMS), seed=2)
+    results = cii_core.CII_ENGINE.evaluate(capacities, types, years, attained)
+
+    for i, (capacity, ship_type, year, attained_cii) in enumerate(zip(capacities, types, years, attained)):
+        reference = cii_core.calculate_reference_cii(capacity, ship_type)
+        required = cii_core.calculate_required_cii(reference, year)
+        assert results['reference_cii'][i] == pytest.approx(reference, rel=1e-12)
+        assert results['required_cii'][i] == pytest.approx(required, rel=1e-12)
+        assert results['rating'][i] == cii_core.calculate_cii_rating(attained_cii, required), (capacity, ship_type)
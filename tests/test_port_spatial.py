@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from port_index import PortIndex
+from port_spatial import PortSpatialIndex, snap_positions
+
+PORTS = pd.DataFrame({
+    'World Port Index Number': [1, 2, 3],
+    'Main Port Name': ['Singapore', 'Rotterdam', 'Cape Town'],
+    'Alternate Port Name': [None, None, None],
+    'UN/LOCODE': ['SG SIN', 'NL RTM', 'ZA CPT'],
+    'Latitude': [1.26, 51.9, -33.9],
+    'Longitude': [103.84, 4.1, 18.4]
+})
+
+
+@pytest.fixture
+def spatial_index():
+    return PortSpatialIndex(PORTS)
+
+
+def test_nearest_leaves_missing_coordinates_unsnapped(spatial_index):
+    positions, distances = spatial_index.nearest([1.3, np.nan, 51.8, 10.0], [103.8, 4.1, np.nan, np.inf])
+    assert positions.tolist() == [0, -1, -1, -1]
+    assert distances[0] < 5 and np.isinf(distances[1:]).all()
+
+
+def test_within_radius_returns_nothing_for_missing_coordinates(spatial_index):
+    matches = spatial_index.within_radius([51.8, np.nan], [4.0, 4.0], 50)
+    assert matches[0].tolist() == [1]
+    assert matches[1].tolist() == []
+
+
+def test_snap_positions_keeps_chunk_with_gaps(spatial_index):
+    chunk = pd.DataFrame({'LATITUDE': [51.85, None, -33.95], 'LONGITUDE': [4.05, 18.4, 18.45]})
+    snapped = snap_positions(chunk, spatial_index, max_distance_nm=20)
+    assert snapped['port'].tolist()[0] == 'Rotterdam'
+    assert pd.isna(snapped['port'].iloc[1])
+    assert snapped['port'].tolist()[2] == 'Cape Town'
+
+
+def test_port_index_resolves_position_lists():
+    port_index = PortIndex(PORTS)
+    assert port_index.lookup([1.27, 103.83])['Main Port Name'] == 'Singapore'
+    assert port_index.lookup('51.9N 4.1E')['Main Port Name'] == 'Rotterdam'
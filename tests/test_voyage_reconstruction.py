@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import text
+
+from benchmarks.synthetic_data import vessel_name
+from queries import fetch_vessel_data
+from tests.conftest import YEAR
+from voyage_reconstruction import LegCache, vessel_legs
+
+
+@pytest.fixture
+def leg_cache(tmp_path):
+    return LegCache(str(tmp_path / 'legs.sqlite'), ports_version='test')
+
+
+@pytest.mark.parametrize('number', [1, 2, 3])
+def test_legs_add_up_to_vessel_query(report_engine, leg_cache, number):
+    expected = fetch_vessel_data(report_engine, vessel_name(number), YEAR).iloc[0]
+    legs = vessel_legs(report_engine, leg_cache, vessel_name(number), YEAR, chunksize=50)
+
+    assert legs['distance'].sum() == pytest.approx(expected['total_distance'], rel=1e-9)
+    assert legs['co2'].sum() == pytest.approx(expected['CO2Emission'], rel=1e-9)
+    # The query rounds the attained AER to two decimals
+    assert legs['aer_contribution'].sum() == pytest.approx(expected['Attained_AER'], abs=0.005)
+
+
+def test_legs_do_not_depend_on_chunking_or_cache(report_engine, leg_cache, tmp_path):
+    streamed = vessel_legs(report_engine, leg_cache, vessel_name(2), YEAR, chunksize=7)
+    cached = vessel_legs(report_engine, leg_cache, vessel_name(2), YEAR)
+    whole = vessel_legs(report_engine, LegCache(str(tmp_path / 'whole.sqlite')), vessel_name(2), YEAR,
+                        chunksize=100000)
+
+    assert (streamed['phase'] == whole['phase']).all()
+    assert streamed[['distance', 'co2']].to_numpy() == pytest.approx(whole[['distance', 'co2']].to_numpy())
+    assert cached[['distance', 'co2']].to_numpy() == pytest.approx(streamed[['distance', 'co2']].to_numpy())
+
+
+def test_cached_legs_follow_fuel_corrections(report_engine, leg_cache):
+    vessel_legs(report_engine, leg_cache, vessel_name(1), YEAR)
+    with report_engine.begin() as conn:
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FUEL_CONSUMPTION_HFO" = 2 * "FUEL_CONSUMPTION_HFO" '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0001\' '
+                          'AND "REPORT_DATE" >= \'2024-03-01\' AND "REPORT_DATE" < \'2024-04-01\''))
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FC_FUEL_CONSUMPTION_LFO" = NULL '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0001\' AND "REPORT_DATE" >= \'2024-05-01\''))
+
+    expected = fetch_vessel_data(report_engine, vessel_name(1), YEAR).iloc[0]
+    legs = vessel_legs(report_engine, leg_cache, vessel_name(1), YEAR)
+    assert legs['co2'].sum() == pytest.approx(expected['CO2Emission'], rel=1e-9)
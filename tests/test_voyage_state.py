@@ -0,0 +1,51 @@
+import pytest
+
+import voyage
+from voyage_state import VoyageState
+
+PORTS = {
+    'ROTTERDAM': {'World Port Index Number': 1, 'Latitude': 51.9, 'Longitude': 4.1},
+    'SINGAPORE': {'World Port Index Number': 2, 'Latitude': 1.3, 'Longitude': 103.8}
+}
+
+ROWS = [['ROTTERDAM', 'SINGAPORE', 2.0, 12.0, 30.0, 'VLSFO']]
+
+
+class Ports:
+    def lookup(self, name):
+        return PORTS[name]
+
+
+class Routes:
+    def get(self, origin, destination):
+        return None
+
+    def put(self, origin, destination, route):
+        pass
+
+
+def test_failed_legs_are_retried_on_the_next_update(monkeypatch):
+    calls = []
+
+    def flaky_route(origin, destination):
+        calls.append((origin, destination))
+        if len(calls) == 1:
+            raise RuntimeError("routing service unavailable")
+        return {'length': 8300.0, 'coordinates': [origin, destination]}
+
+    monkeypatch.setattr(voyage, 'compute_route', flaky_route)
+    state = VoyageState()
+
+    assert state.update(ROWS, Ports(), Routes()) == [0]
+    assert state.errors() and state.legs == 0
+
+    assert state.update(ROWS, Ports(), Routes()) == [0]
+    assert len(calls) == 2
+    assert state.errors() == []
+    assert state.legs == 1
+    assert state.totals['distance'] == pytest.approx(8300.0)
+
+    # A leg that routed is kept and not routed again
+    assert state.update(ROWS, Ports(), Routes()) == []
+    assert len(calls) == 2
+    assert state.totals['distance'] == pytest.approx(8300.0)
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from benchmarks.synthetic_data import vessel_name
+from queries import fetch_vessel_data
+from tests.conftest import YEAR
+from ytd_tracker import YTDTracker
+
+
+def tracked(engine, tracker, number):
+    with engine.connect() as conn:
+        return tracker.update(conn, vessel_name(number), YEAR)
+
+
+@pytest.mark.parametrize('number', [1, 2, 3])
+def test_tracker_matches_vessel_query(report_engine, number):
+    expected = fetch_vessel_data(report_engine, vessel_name(number), YEAR)
+    actual = tracked(report_engine, YTDTracker(), number)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+def test_tracker_follows_late_and_corrected_reports(report_engine):
+    december = 'WHERE "VESSEL_NAME" = \'BENCH-0002\' AND "REPORT_DATE" >= \'2024-12-01\''
+    with report_engine.begin() as conn:
+        conn.execute(text(f'CREATE TABLE late_reports AS SELECT * FROM "sf_consumption_logs" {december}'))
+        conn.execute(text(f'DELETE FROM "sf_consumption_logs" {december}'))
+    tracker = YTDTracker()
+    tracked(report_engine, tracker, 2)
+
+    with report_engine.begin() as conn:
+        # A correction inside the re-scan window, then the reports that arrived late
+        conn.execute(text('UPDATE "sf_consumption_logs" SET "FUEL_CONSUMPTION_GO_DO" = NULL '
+                          'WHERE "VESSEL_NAME" = \'BENCH-0002\' AND "REPORT_DATE" >= \'2024-11-29\''))
+        conn.execute(text('INSERT INTO "sf_consumption_logs" SELECT * FROM late_reports'))
+    expected = fetch_vessel_data(report_engine, vessel_name(2), YEAR)
+    pd.testing.assert_frame_equal(tracked(report_engine, tracker, 2), expected,
+                                  check_dtype=False, check_exact=False, rtol=1e-9)
@@ -0,0 +1,194 @@
+"""Lightweight span tracing of the CII hot paths.
+
+A trace covers one unit of work (a Streamlit rerun, an API request). While
+it is active, span() times nested stages, count() accumulates counters and
+watch_cache() records the hits and misses a cache served during the trace.
+Outside a trace these calls cost a context variable lookup. Finished traces
+export as OTLP/JSON (the OpenTelemetry protocol's JSON encoding), one
+ExportTraceServiceRequest per line.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Append finished traces to this file when set
+TRACE_FILE = os.environ.get('CII_TRACE_FILE')
+
+SERVICE_NAME = 'cii-calculator'
+
+_current_trace = ContextVar('cii_trace', default=None)
+_current_span = ContextVar('cii_span', default=None)
+_export_lock = threading.Lock()
+
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans, counters and cache statistics of one unit of work"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = _new_id(16)
+        self.root = Span(name, self.trace_id, None, attributes)
+        self.spans = [self.root]
+        self.counters = defaultdict(float)
+        self.caches = {}
+        self._cache_sources = {}
+
+    def watch_cache(self, name, stats):
+        """Track a cache through a callable returning its cumulative (hits, misses)"""
+        self._cache_sources[name] = (stats, stats())
+
+    def finish(self):
+        self.root.end_ns = time.time_ns()
+        for name, (stats, (hits_before, misses_before)) in self._cache_sources.items():
+            hits, misses = stats()
+            self.caches[name] = {'hits': hits - hits_before, 'misses': misses - misses_before}
+
+    def stage_summary(self):
+        """Per span name: calls, total and maximum milliseconds, in first-seen order"""
+        summary = {}
+        for recorded in self.spans[1:]:
+            stage = summary.setdefault(recorded.name,
+                                       {'stage': recorded.name, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stage['calls'] += 1
+            stage['total_ms'] += recorded.duration_ms
+            stage['max_ms'] = max(stage['max_ms'], recorded.duration_ms)
+        return list(summary.values())
+
+    def cache_summary(self):
+        """Per watched cache: hits, misses and hit ratio during the trace"""
+        return [
+            {'cache': name, 'hits': stats['hits'], 'misses': stats['misses'],
+             'hit_ratio': stats['hits'] / (stats['hits'] + stats['misses']) if stats['hits'] + stats['misses'] else None}
+            for name, stats in self.caches.items()
+        ]
+
+    def to_otlp(self):
+        """Return the trace as an OTLP/JSON ExportTraceServiceRequest"""
+        root_attributes = dict(self.root.attributes)
+        root_attributes.update({f'counter.{name}': value for name, value in self.counters.items()})
+        for name, stats in self.caches.items():
+            root_attributes[f'cache.{name}.hits'] = stats['hits']
+            root_attributes[f'cache.{name}.misses'] = stats['misses']
+
+        spans = []
+        for recorded in self.spans:
+            attributes = root_attributes if recorded is self.root else recorded.attributes
+            otlp_span = {
+                'traceId': recorded.trace_id,
+                'spanId': recorded.span_id,
+                'name': recorded.name,
+                'kind': 1,
+                'startTimeUnixNano': str(recorded.start_ns),
+                'endTimeUnixNano': str(recorded.end_ns or time.time_ns()),
+                'attributes': [_otlp_attribute(key, value) for key, value in attributes.items()],
+                'status': {'code': 2, 'message': recorded.error} if recorded.error else {'code': 1}
+            }
+            if recorded.parent_id:
+                otlp_span['parentSpanId'] = recorded.parent_id
+            spans.append(otlp_span)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}]
+        }]}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+@contextmanager
+def trace(name, **attributes):
+    """Collect spans into a new trace for the duration of the block"""
+    current = Trace(name, **attributes)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(current.root)
+    try:
+        yield current
+    except BaseException as e:
+        current.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage as a child of the current span; yields the span (None outside a trace)"""
+    active = _current_trace.get()
+    if active is None:
+        yield None
+        return
+    current = Span(name, active.trace_id, _current_span.get().span_id, attributes)
+    active.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def annotate(**attributes):
+    """Set attributes on the current span"""
+    if _current_trace.get() is not None:
+        _current_span.get().attributes.update(attributes)
+
+
+def count(name, value=1):
+    """Add to a counter of the current trace"""
+    active = _current_trace.get()
+    if active is not None:
+        active.counters[name] += value
+
+
+def export_trace(finished, path=TRACE_FILE):
+    """Append a finished trace to an OTLP/JSON lines file"""
+    if not path:
+        return
+    line = json.dumps(finished.to_otlp())
+    with _export_lock:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(line + '\n')
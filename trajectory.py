@@ -0,0 +1,176 @@
+"""Multi-year CII trajectories for a fleet under several operating profiles.
+
+Usage:
+    python trajectory.py [--base-year 2024] [--years 2025 2026 2027 2028 2029 2030]
+        [--schedule imo_2023_2030] [--imos 9000001 9000002] [--output trajectory.csv]
+
+The baseline attained AER of every vessel comes from the consumption logs of
+the base year. Each profile scales it and every projected year is rated
+against the required CII of that year's reduction factor, for all vessels,
+profiles and years at once.
+"""
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from cii_engine import CIIEngine, RATINGS, REDUCTION_FACTORS
+
+# Reduction factors by year. The 2024-2026 factors tighten by 2 points a year;
+# the 2027-2030 factors (13.625, 16.25, 18.875 and 21.5 % below the 2019
+# reference) are the ones adopted by the IMO at MEPC 83.
+REDUCTION_SCHEDULES = {
+    'imo_2023_2026': dict(REDUCTION_FACTORS),
+    'imo_2023_2030': {
+        **REDUCTION_FACTORS,
+        2027: 0.86375,
+        2028: 0.8375,
+        2029: 0.81125,
+        2030: 0.785
+    }
+}
+
+# Operating profiles relative to the baseline year:
+# speed_factor scales speed (fuel per mile and so AER follow speed squared),
+# fuel_co2_factor scales CO2 per tonne of fuel (fuel switching) and
+# annual_aer_change compounds every year after the base year (efficiency drift).
+OPERATING_PROFILES = {
+    'as_is': {'speed_factor': 1.0, 'fuel_co2_factor': 1.0, 'annual_aer_change': 0.0},
+    'slow_steaming': {'speed_factor': 0.9, 'fuel_co2_factor': 1.0, 'annual_aer_change': 0.0},
+    'efficiency_program': {'speed_factor': 1.0, 'fuel_co2_factor': 1.0, 'annual_aer_change': -0.02},
+    'biofuel_blend': {'speed_factor': 1.0, 'fuel_co2_factor': 0.9, 'annual_aer_change': 0.0},
+}
+
+# Number of consecutive D ratings that triggers a corrective action plan
+CONSECUTIVE_D_LIMIT = 3
+
+
+def schedule_factors(schedule, years):
+    """Return the reduction factor of every year, refusing years the schedule does not cover"""
+    missing = [year for year in years if year not in schedule]
+    if missing:
+        raise ValueError(f"No reduction factor for year(s) {', '.join(map(str, missing))}")
+    return np.array([schedule[year] for year in years], dtype=float)
+
+
+def profile_multipliers(profiles, years, base_year):
+    """Return the (profiles, years) factor applied to the baseline AER"""
+    offsets = np.asarray(years, dtype=float) - base_year
+    speed = np.array([profile['speed_factor'] for profile in profiles.values()])
+    fuel = np.array([profile['fuel_co2_factor'] for profile in profiles.values()])
+    drift = np.array([profile['annual_aer_change'] for profile in profiles.values()])
+    return (speed ** 2 * fuel)[:, None] * (1 + drift)[:, None] ** offsets[None, :]
+
+
+def project_trajectories(capacities, ship_types, baseline_aer, base_year, years,
+                         profiles=OPERATING_PROFILES, schedule=REDUCTION_SCHEDULES['imo_2023_2030'],
+                         engine=None):
+    """Attained and required CII and ratings of vessels x profiles x years.
+
+    Returns a dict with 'attained' (vessels, profiles, years), 'required'
+    (vessels, years), 'rating' (vessels, profiles, years; None where the
+    vessel cannot be rated), 'consecutive_d' and 'any_e' (vessels, profiles).
+    """
+    engine = engine or CIIEngine()
+    years = list(years)
+    codes = engine.ship_type_codes(ship_types)
+    capacities = np.asarray(capacities, dtype=float)
+    baseline_aer = np.asarray(baseline_aer, dtype=float)
+
+    reference = engine.reference_cii(capacities, codes)
+    required = reference[:, None] * schedule_factors(schedule, years)[None, :]
+    # Rating boundaries are proportional to the required CII, so scale unit boundaries per vessel
+    boundary_ratios = engine.rating_bounds(np.ones(len(capacities)), codes, capacities)
+    bounds = required[:, None, :, None] * boundary_ratios[:, None, None, :]
+
+    attained = baseline_aer[:, None, None] * profile_multipliers(profiles, years, base_year)[None, :, :]
+    rating_index = (attained[..., None] > bounds).sum(axis=-1)
+    valid = ~(np.isnan(attained) | np.isnan(bounds).any(axis=-1))
+    ratings = RATINGS[rating_index]
+    ratings[~valid] = None
+
+    is_d = valid & (rating_index == list(RATINGS).index('D'))
+    runs = np.zeros(is_d.shape[:2], dtype=np.int64)
+    longest = np.zeros(is_d.shape[:2], dtype=np.int64)
+    for year_position in range(len(years)):
+        runs = np.where(is_d[..., year_position], runs + 1, 0)
+        longest = np.maximum(longest, runs)
+
+    return {
+        'years': years,
+        'profiles': list(profiles),
+        'attained': attained,
+        'required': required,
+        'rating': ratings,
+        'consecutive_d': longest >= CONSECUTIVE_D_LIMIT,
+        'any_e': (valid & (rating_index == list(RATINGS).index('E'))).any(axis=-1)
+    }
+
+
+def trajectory_frame(vessels, trajectories):
+    """Flatten projected trajectories into one row per vessel, profile and year"""
+    n, p, y = trajectories['attained'].shape
+    frame = pd.DataFrame({
+        'Vessel': np.repeat(vessels['Vessel'].to_numpy(), p * y),
+        'IMO': np.repeat(vessels['IMO'].to_numpy(), p * y),
+        'profile': np.tile(np.repeat(np.array(trajectories['profiles'], dtype=object), y), n),
+        'year': np.tile(trajectories['years'], n * p),
+        'attained_aer': trajectories['attained'].ravel(),
+        'required_cii': np.repeat(trajectories['required'][:, None, :], p, axis=1).ravel(),
+        'rating': trajectories['rating'].ravel()
+    })
+    frame['consecutive_d'] = np.repeat(trajectories['consecutive_d'].ravel(), y)
+    frame['any_e'] = np.repeat(trajectories['any_e'].ravel(), y)
+    return frame
+
+
+def flagged_vessels(vessels, trajectories):
+    """Return the vessel-profile pairs heading for three consecutive D ratings or any E"""
+    n, p = trajectories['consecutive_d'].shape
+    flags = pd.DataFrame({
+        'Vessel': np.repeat(vessels['Vessel'].to_numpy(), p),
+        'IMO': np.repeat(vessels['IMO'].to_numpy(), p),
+        'profile': np.tile(np.array(trajectories['profiles'], dtype=object), n),
+        'consecutive_d': trajectories['consecutive_d'].ravel(),
+        'any_e': trajectories['any_e'].ravel()
+    })
+    return flags[flags['consecutive_d'] | flags['any_e']].reset_index(drop=True)
+
+
+def fleet_trajectories(fleet_df, base_year, years, profiles=OPERATING_PROFILES,
+                       schedule=REDUCTION_SCHEDULES['imo_2023_2030'], engine=None):
+    """Project a fleet query result (Vessel, IMO, capacity, imo_ship_type, Attained_AER)"""
+    trajectories = project_trajectories(
+        fleet_df['capacity'].to_numpy(dtype=float),
+        fleet_df['imo_ship_type'].to_numpy(dtype=object),
+        fleet_df['Attained_AER'].to_numpy(dtype=float),
+        base_year, years, profiles, schedule, engine
+    )
+    return trajectory_frame(fleet_df, trajectories), flagged_vessels(fleet_df, trajectories)
+
+
+def main():
+    from cii_core import CII_ENGINE, VESSEL_TYPE_MAPPING, get_db_engine, get_fleet_data
+
+    parser = argparse.ArgumentParser(description="Project fleet CII trajectories")
+    parser.add_argument("--base-year", type=int, default=date.today().year)
+    parser.add_argument("--years", type=int, nargs='+', default=list(range(2025, 2031)))
+    parser.add_argument("--schedule", choices=list(REDUCTION_SCHEDULES), default='imo_2023_2030')
+    parser.add_argument("--imos", type=int, nargs='*')
+    parser.add_argument("--output", default="trajectory.csv")
+    args = parser.parse_args()
+
+    fleet_df = get_fleet_data(get_db_engine(), args.base_year, args.imos)
+    fleet_df['imo_ship_type'] = fleet_df['vessel_type'].map(VESSEL_TYPE_MAPPING)
+    frame, flags = fleet_trajectories(fleet_df, args.base_year, args.years,
+                                      schedule=REDUCTION_SCHEDULES[args.schedule], engine=CII_ENGINE)
+    frame.to_csv(args.output, index=False)
+    print(f"Wrote {len(frame)} rows to {args.output}")
+    print(f"{len(flags)} vessel-profile combinations flagged")
+    if not flags.empty:
+        print(flags.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
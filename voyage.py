@@ -0,0 +1,163 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from route_cache import compute_route, port_coordinates, port_key
+from tracing import annotate, span
+
+# Emission factors for different fuel types
+EMISSION_FACTORS = {
+    'VLSFO': 3.151,
+    'LSMGO': 3.206,
+    'LNG': 2.75
+}
+
+# Routing pool used for legs that are neither precomputed nor cached. Threads
+# share the loaded searoute graph; 'process' is opt-in, since every child
+# process of the Streamlit server or an API worker loads the graph again
+VOYAGE_EXECUTOR = os.environ.get('CII_VOYAGE_EXECUTOR', 'thread')
+VOYAGE_WORKERS = int(os.environ.get('CII_VOYAGE_WORKERS', min(4, os.cpu_count() or 1)))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind=VOYAGE_EXECUTOR, max_workers=VOYAGE_WORKERS):
+    """Return a shared thread or process pool for routing"""
+    with _executors_lock:
+        key = (kind, max_workers)
+        if key not in _executors:
+            pool_class = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+            _executors[key] = pool_class(max_workers=max_workers)
+        return _executors[key]
+
+
+def row_is_complete(row):
+    """Check if all required fields of a voyage row are filled"""
+    return all([row[0], row[1], row[2], row[3], row[4], row[5]])
+
+
+def segment_metrics(row, distance):
+    """Calculate metrics for a voyage segment of known distance"""
+    # Calculate time at sea (days)
+    sea_time = distance / (row[3] * 24)  # speed in knots
+
+    # Total segment time (sea time + port time)
+    total_time = sea_time + row[2]  # port days
+
+    # Calculate CO2 emissions based on fuel type
+    co2_emissions = row[4] * sea_time * EMISSION_FACTORS[row[5]]  # fuel used * emission factor
+
+    return {
+        'from_port': row[0],
+        'to_port': row[1],
+        'distance': distance,
+        'sea_time': sea_time,
+        'port_time': row[2],
+        'total_time': total_time,
+        'speed': row[3],
+        'fuel_used': row[4],
+        'fuel_type': row[5],
+        'co2_emissions': co2_emissions
+    }
+
+
+def resolve_legs(rows, port_index):
+    """Resolve the ports of all complete rows in one pass.
+
+    Returns a list with, per row, the (origin, destination) port rows, None for
+    incomplete rows, or the exception raised while resolving.
+    """
+    resolved = {}
+    legs = []
+    with span('port_resolution', rows=len(rows)):
+        for row in rows:
+            if not row_is_complete(row):
+                legs.append(None)
+                continue
+            try:
+                for name in (row[0], row[1]):
+                    if name not in resolved:
+                        resolved[name] = port_index.lookup(name)
+                legs.append((resolved[row[0]], resolved[row[1]]))
+            except Exception as e:
+                legs.append(e)
+        annotate(ports=len(resolved))
+    return legs
+
+
+def route_legs(leg_ports, route_cache, distance_matrix=None, max_workers=VOYAGE_WORKERS, executor=VOYAGE_EXECUTOR):
+    """Return the distance (NM) or routing exception of each unique (origin, destination) key pair.
+
+    Legs found in the distance matrix or the route cache are answered directly;
+    the remaining ones are routed concurrently and written back to the cache.
+    """
+    with span('routing'):
+        distances = _route_legs(leg_ports, route_cache, distance_matrix, max_workers, executor)
+    return distances
+
+
+def _route_legs(leg_ports, route_cache, distance_matrix, max_workers, executor):
+    distances = {}
+    pending = {}
+    for origin_port, destination_port in leg_ports:
+        key = (port_key(origin_port), port_key(destination_port))
+        if key in distances or key in pending:
+            continue
+        distance = distance_matrix.lookup(*key) if distance_matrix is not None else None
+        if distance is None:
+            route = route_cache.get(*key)
+            distance = route['length'] if route is not None else None
+        if distance is None:
+            pending[key] = (port_coordinates(origin_port), port_coordinates(destination_port))
+        else:
+            distances[key] = distance
+
+    annotate(legs=len(distances) + len(pending), routed=len(pending))
+    if len(pending) == 1 or max_workers <= 1:
+        futures = None
+    else:
+        pool = get_executor(executor, max_workers)
+        futures = {key: pool.submit(compute_route, *coordinates) for key, coordinates in pending.items()}
+
+    for key, coordinates in pending.items():
+        try:
+            route = futures[key].result() if futures else compute_route(*coordinates)
+        except Exception as e:
+            distances[key] = e
+            continue
+        route_cache.put(*key, route)
+        distances[key] = route['length']
+    return distances
+
+
+def evaluate_voyage(rows, port_index, route_cache, distance_matrix=None,
+                    max_workers=VOYAGE_WORKERS, executor=VOYAGE_EXECUTOR):
+    """Calculate segment metrics for every row of a voyage table.
+
+    Identical legs are routed once and unique legs are routed concurrently.
+    Results come back in input order: None for incomplete rows, the segment
+    metrics otherwise, with an 'error' message instead when the leg failed.
+    """
+    legs = resolve_legs(rows, port_index)
+    distances = route_legs([leg for leg in legs if isinstance(leg, tuple)], route_cache,
+                           distance_matrix, max_workers, executor)
+
+    results = []
+    for row, leg in zip(rows, legs):
+        if leg is None:
+            results.append(None)
+            continue
+        if isinstance(leg, Exception):
+            results.append({'from_port': row[0], 'to_port': row[1], 'error': f"Could not resolve ports: {leg}"})
+            continue
+        distance = distances[(port_key(leg[0]), port_key(leg[1]))]
+        if isinstance(distance, Exception):
+            results.append({'from_port': row[0], 'to_port': row[1],
+                            'error': f"Could not route {row[0]} to {row[1]}: {distance}"})
+            continue
+        try:
+            results.append(segment_metrics(row, int(distance)))
+        except Exception as e:
+            results.append({'from_port': row[0], 'to_port': row[1], 'error': f"Error calculating segment metrics: {e}"})
+    return results
@@ -0,0 +1,403 @@
+"""Leg-level voyage history reconstructed from sf_consumption_logs.
+
+Usage:
+    python voyage_reconstruction.py --years 2023 2024 [--vessels NAME ...]
+        [--chunksize 50000] [--output fleet_legs.csv] [--refresh]
+
+A vessel-year's reports are streamed in date order and in chunks, and split
+into legs: runs of reports with at most PORT_STAY_DISTANCE NM travelled are
+port stays (in port, at anchor or drifting), other runs are sea passages.
+Legs are cut at the calendar year boundary like the CII itself. When the
+logs carry LATITUDE/LONGITUDE, port stays are named after the nearest port
+and sea passages after the stays around them.
+
+Each leg gets its distance, CO2, own AER and contribution to the annual AER
+(the contributions add up to the attained AER of the CII queries). Legs are cached per
+vessel-year in SQLite and rebuilt only when the vessel-year's reports change,
+so memory is bounded by one chunk plus one vessel-year's legs.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, inspect, text
+
+from db import connect
+from port_index import MAX_SNAP_DISTANCE_NM
+from queries import FUEL_CO2_FACTORS, year_bounds
+from ytd_tracker import PARTICULARS_QUERY, REPORT_COLUMNS, report_readings, reported_fuels
+
+LEG_CACHE_PATH = os.path.join(".cache", "voyage_legs.sqlite")
+
+# Reports with at most this distance travelled (NM) count as a port stay
+PORT_STAY_DISTANCE = 10.0
+
+DEFAULT_CHUNKSIZE = 50000
+
+# Bumped when the way legs are computed changes, so cached legs are rebuilt
+LEG_FORMAT = 'legs-2'
+
+POSITION_COLUMNS = ['LATITUDE', 'LONGITUDE']
+
+_CO2_FACTORS = np.array(list(FUEL_CO2_FACTORS.values()))
+
+LEG_COLUMNS = ['leg', 'phase', 'start_date', 'end_date', 'reports', 'distance', 'co2', 'from_port', 'to_port']
+
+# Per-column sums and reading counts of a vessel-year; any of them changes when a
+# distance or fuel reading is corrected, added or cleared
+SOURCE_COLUMNS_SQL = ",\n        ".join(
+    f'SUM("{column}") AS "sum_{column}", COUNT("{column}") AS "count_{column}"' for column in REPORT_COLUMNS
+)
+
+SOURCE_QUERY = f"""
+    SELECT
+        "VESSEL_NAME" AS "vessel",
+        MAX("VESSEL_IMO") AS "imo",
+        COUNT(*) AS "reports",
+        MAX("REPORT_DATE") AS "last_report",
+        {SOURCE_COLUMNS_SQL}
+    FROM
+        "sf_consumption_logs"
+    WHERE
+        "REPORT_DATE" >= :start_date
+        AND "REPORT_DATE" < :end_date
+        {{vessel_filter}}
+    GROUP BY
+        "VESSEL_NAME"
+    ORDER BY
+        "VESSEL_NAME"
+"""
+
+REPORTS_QUERY = """
+    SELECT
+        "REPORT_DATE",
+        "DISTANCE_TRAVELLED_ACTUAL",
+        {columns}
+    FROM
+        "sf_consumption_logs"
+    WHERE
+        "VESSEL_NAME" = :vessel_name
+        AND "REPORT_DATE" >= :start_date
+        AND "REPORT_DATE" < :end_date
+    ORDER BY
+        "REPORT_DATE"
+"""
+
+
+def source_fingerprint(row):
+    """Fingerprint of a vessel-year's reports; changes when reports are added, removed or corrected"""
+    readings = [f"{float(row[f'sum_{column}']):.6f}:{int(row[f'count_{column}'])}"
+                if row[f'count_{column}'] else "-" for column in REPORT_COLUMNS]
+    return "/".join([str(int(row['reports'])), pd.Timestamp(row['last_report']).isoformat(), *readings])
+
+
+def leg_cache_version(ports_version, port_stay_distance=PORT_STAY_DISTANCE):
+    """Build the cache version key from the port dataset and the segmentation settings"""
+    return f"{ports_version}/port-stay-{port_stay_distance:g}/{LEG_FORMAT}"
+
+
+class LegSegmenter:
+    """Splits a date-ordered stream of report chunks into port stays and sea passages.
+
+    Runs are summed per chunk with np.add.reduceat; the last run of a chunk
+    stays open and is merged with the first run of the next chunk when both
+    are of the same phase.
+    """
+
+    def __init__(self, port_stay_distance=PORT_STAY_DISTANCE):
+        self.port_stay_distance = port_stay_distance
+        self.legs = []
+        self._open = None
+
+    def add(self, reports):
+        if reports.empty:
+            return
+        dates = pd.to_datetime(reports['REPORT_DATE']).to_numpy()
+        contributions = report_readings(reports)
+        at_sea = contributions[:, 0] > self.port_stay_distance
+        starts = np.flatnonzero(np.r_[True, at_sea[1:] != at_sea[:-1]])
+        ends = np.r_[starts[1:], len(reports)] - 1
+        sums = np.add.reduceat(contributions, starts, axis=0)
+        has_positions = all(column in reports for column in POSITION_COLUMNS)
+        if has_positions:
+            positions = reports[POSITION_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+        for start, end, run_sums in zip(starts, ends, sums):
+            run = {
+                'phase': 'sea' if at_sea[start] else 'port',
+                'start_date': dates[start],
+                'end_date': dates[end],
+                'reports': int(end - start + 1),
+                'totals': run_sums,
+                'position': None
+            }
+            if has_positions:
+                located = positions[start:end + 1][~np.isnan(positions[start:end + 1]).any(axis=1)]
+                run['position'] = located[-1] if len(located) else None
+            self._extend(run)
+
+    def _extend(self, run):
+        if self._open is not None and self._open['phase'] == run['phase']:
+            self._open['end_date'] = run['end_date']
+            self._open['reports'] += run['reports']
+            self._open['totals'] = self._open['totals'] + run['totals']
+            if run['position'] is not None:
+                self._open['position'] = run['position']
+            return
+        if self._open is not None:
+            self.legs.append(self._open)
+        self._open = run
+
+    def finish(self, spatial_index=None):
+        """Close the stream and return the legs as a DataFrame of LEG_COLUMNS"""
+        if self._open is not None:
+            self.legs.append(self._open)
+            self._open = None
+        totals = np.array([leg['totals'] for leg in self.legs]).reshape(-1, 2 * len(REPORT_COLUMNS))
+        sums = totals[:, :len(REPORT_COLUMNS)]
+        # A fuel counts only when the vessel-year has readings of both its consumption and
+        # FC_ column, as in the CII queries; then the legs' net fuel adds up to the annual one
+        net = (sums[:, 1::2] - sums[:, 2::2]) * reported_fuels(totals.sum(axis=0))
+        legs = pd.DataFrame({
+            'leg': np.arange(1, len(self.legs) + 1),
+            'phase': [leg['phase'] for leg in self.legs],
+            'start_date': [leg['start_date'] for leg in self.legs],
+            'end_date': [leg['end_date'] for leg in self.legs],
+            'reports': [leg['reports'] for leg in self.legs],
+            'distance': sums[:, 0],
+            'co2': net @ _CO2_FACTORS,
+            'from_port': None,
+            'to_port': None
+        }, columns=LEG_COLUMNS)
+        if spatial_index is not None:
+            name_ports(legs, [leg['position'] for leg in self.legs], spatial_index)
+        return legs
+
+
+def name_ports(legs, positions, spatial_index, max_distance_nm=MAX_SNAP_DISTANCE_NM):
+    """Name port stays after the nearest port to their last position, and sea passages after their neighbours"""
+    stays = [i for i, phase in enumerate(legs['phase']) if phase == 'port' and positions[i] is not None]
+    if not stays:
+        return legs
+    located = np.array([positions[i] for i in stays])
+    rows, _ = spatial_index.nearest(located[:, 0], located[:, 1], max_distance_nm)
+    names = spatial_index.ports['Main Port Name'].astype(object).to_numpy()
+
+    port_names = [None] * len(legs)
+    for i, row in zip(stays, rows):
+        port_names[i] = names[row] if row >= 0 else None
+    from_ports, to_ports = port_names[:], port_names[:]
+    for i, phase in enumerate(legs['phase']):
+        if phase == 'sea':
+            from_ports[i] = port_names[i - 1] if i > 0 else None
+            to_ports[i] = port_names[i + 1] if i + 1 < len(legs) else None
+    legs['from_port'] = from_ports
+    legs['to_port'] = to_ports
+    return legs
+
+
+def reconstruct_vessel_year(conn, vessel_name, year, chunksize=DEFAULT_CHUNKSIZE,
+                            port_stay_distance=PORT_STAY_DISTANCE, spatial_index=None):
+    """Stream one vessel-year's reports and return its legs"""
+    available = {column['name'] for column in inspect(conn).get_columns('sf_consumption_logs')}
+    columns = [f'"FUEL_CONSUMPTION_{fuel}", "FC_FUEL_CONSUMPTION_{fuel}"' for fuel in FUEL_CO2_FACTORS]
+    if spatial_index is not None and available.issuperset(POSITION_COLUMNS):
+        columns += [f'"{column}"' for column in POSITION_COLUMNS]
+    query = text(REPORTS_QUERY.format(columns=", ".join(columns))).execution_options(query_name='voyage_reports')
+
+    start_date, end_date = year_bounds(year)
+    segmenter = LegSegmenter(port_stay_distance)
+    # stream_results keeps only one chunk of rows client-side (a server-side cursor on PostgreSQL)
+    stream = conn.execution_options(stream_results=True)
+    for chunk in pd.read_sql(query, stream, chunksize=chunksize,
+                             params={'vessel_name': vessel_name, 'start_date': start_date, 'end_date': end_date}):
+        segmenter.add(chunk)
+    return segmenter.finish(spatial_index)
+
+
+def leg_attribution(legs, capacity):
+    """Add each sea passage's AER, every leg's contribution to the annual AER and its share of the CO2"""
+    legs = legs.copy()
+    total_distance, total_co2 = legs['distance'].sum(), legs['co2'].sum()
+    legs['aer'] = np.nan
+    legs['aer_contribution'] = np.nan
+    if capacity is not None and not pd.isna(capacity) and capacity > 0:
+        sea_distance = legs['distance'].where((legs['phase'] == 'sea') & (legs['distance'] > 0))
+        legs['aer'] = legs['co2'] * 1000000 / (sea_distance * capacity)
+        if total_distance > 0:
+            legs['aer_contribution'] = legs['co2'] * 1000000 / (total_distance * capacity)
+    legs['co2_share'] = legs['co2'] / total_co2 if total_co2 else np.nan
+    return legs
+
+
+class LegCache:
+    """SQLite store of reconstructed legs per vessel-year.
+
+    A vessel-year is stored with the fingerprint of the reports it was built
+    from; entries written under a different version key (port dataset or
+    segmentation settings) are dropped when the cache is opened.
+    """
+
+    def __init__(self, path=LEG_CACHE_PATH, ports_version='', port_stay_distance=PORT_STAY_DISTANCE):
+        self.port_stay_distance = port_stay_distance
+        self.version = leg_cache_version(ports_version, port_stay_distance)
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS vessel_years (
+                    version TEXT NOT NULL,
+                    vessel TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    imo INTEGER,
+                    capacity REAL,
+                    vessel_type TEXT,
+                    PRIMARY KEY (version, vessel, year)
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS legs (
+                    version TEXT NOT NULL,
+                    vessel TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    leg INTEGER NOT NULL,
+                    phase TEXT NOT NULL,
+                    start_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    reports INTEGER NOT NULL,
+                    distance REAL NOT NULL,
+                    co2 REAL NOT NULL,
+                    from_port TEXT,
+                    to_port TEXT,
+                    PRIMARY KEY (version, vessel, year, leg)
+                )
+            """)
+            self._db.execute("DELETE FROM vessel_years WHERE version <> ?", (self.version,))
+            self._db.execute("DELETE FROM legs WHERE version <> ?", (self.version,))
+
+    def source(self, vessel_name, year):
+        """Return the report fingerprint a vessel-year was built from, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT source FROM vessel_years WHERE version = ? AND vessel = ? AND year = ?",
+                                   (self.version, vessel_name, year)).fetchone()
+        return row[0] if row else None
+
+    def get(self, vessel_name, year):
+        """Return (vessel particulars, legs) of a cached vessel-year, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT imo, capacity, vessel_type FROM vessel_years WHERE version = ? AND vessel = ? AND year = ?",
+                (self.version, vessel_name, year)
+            ).fetchone()
+            if row is None:
+                return None
+            legs = pd.read_sql(f"SELECT {', '.join(LEG_COLUMNS)} FROM legs "
+                               "WHERE version = ? AND vessel = ? AND year = ? ORDER BY leg",
+                               self._db, params=(self.version, vessel_name, year))
+        legs['start_date'] = pd.to_datetime(legs['start_date'])
+        legs['end_date'] = pd.to_datetime(legs['end_date'])
+        return {'imo': row[0], 'capacity': row[1], 'vessel_type': row[2]}, legs
+
+    def put(self, vessel_name, year, source, particulars, legs):
+        """Replace a vessel-year's legs"""
+        records = [
+            (self.version, vessel_name, year, int(leg.leg), leg.phase, pd.Timestamp(leg.start_date).isoformat(),
+             pd.Timestamp(leg.end_date).isoformat(), int(leg.reports), float(leg.distance), float(leg.co2),
+             leg.from_port, leg.to_port)
+            for leg in legs.itertuples(index=False)
+        ]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM legs WHERE version = ? AND vessel = ? AND year = ?",
+                             (self.version, vessel_name, year))
+            self._db.executemany("INSERT INTO legs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+            self._db.execute(
+                "INSERT OR REPLACE INTO vessel_years VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.version, vessel_name, year, source, particulars['imo'], particulars['capacity'],
+                 particulars['vessel_type'])
+            )
+
+
+def _vessel_sources(conn, year, vessel_names=None):
+    start_date, end_date = year_bounds(year)
+    params = {'start_date': start_date, 'end_date': end_date}
+    if vessel_names:
+        query = text(SOURCE_QUERY.format(vessel_filter='AND "VESSEL_NAME" IN :vessel_names'))
+        query = query.bindparams(bindparam('vessel_names', expanding=True))
+        params['vessel_names'] = list(vessel_names)
+    else:
+        query = text(SOURCE_QUERY.format(vessel_filter=''))
+    return pd.read_sql(query.execution_options(query_name='voyage_sources'), conn, params=params)
+
+
+def _particulars(conn, imo):
+    particulars = pd.read_sql(PARTICULARS_QUERY, conn, params={'imo': int(imo)})
+    if particulars.empty:
+        return {'imo': int(imo), 'capacity': None, 'vessel_type': None}
+    return {'imo': int(imo), 'capacity': float(particulars['capacity'].iloc[0]),
+            'vessel_type': particulars['vessel_type'].iloc[0]}
+
+
+def _legs(conn, cache, source_row, year, chunksize, spatial_index, refresh):
+    vessel_name = source_row['vessel']
+    source = source_fingerprint(source_row)
+    if not refresh and cache.source(vessel_name, year) == source:
+        cached = cache.get(vessel_name, year)
+        if cached is not None:
+            return cached
+    legs = reconstruct_vessel_year(conn, vessel_name, year, chunksize, cache.port_stay_distance, spatial_index)
+    particulars = _particulars(conn, source_row['imo'])
+    cache.put(vessel_name, year, source, particulars, legs)
+    return particulars, legs
+
+
+def vessel_legs(engine, cache, vessel_name, year, spatial_index=None, chunksize=DEFAULT_CHUNKSIZE, refresh=False):
+    """Return the legs of a vessel-year with their AER attribution, rebuilding them if the reports changed"""
+    with connect(engine) as conn:
+        sources = _vessel_sources(conn, year, [vessel_name])
+        if sources.empty:
+            return leg_attribution(pd.DataFrame(columns=LEG_COLUMNS), None)
+        particulars, legs = _legs(conn, cache, sources.iloc[0], year, chunksize, spatial_index, refresh)
+    return leg_attribution(legs, particulars['capacity'])
+
+
+def fleet_legs(engine, cache, years, vessel_names=None, spatial_index=None, chunksize=DEFAULT_CHUNKSIZE,
+               refresh=False):
+    """Yield (vessel, year, legs with AER attribution) for every vessel-year, one at a time"""
+    with connect(engine) as conn:
+        for year in years:
+            for _, source_row in _vessel_sources(conn, year, vessel_names).iterrows():
+                particulars, legs = _legs(conn, cache, source_row, year, chunksize, spatial_index, refresh)
+                yield source_row['vessel'], year, leg_attribution(legs, particulars['capacity'])
+
+
+def main():
+    from cii_core import get_db_engine, get_leg_cache, get_port_index
+
+    parser = argparse.ArgumentParser(description="Reconstruct voyage legs and their CII attribution")
+    parser.add_argument("--years", type=int, nargs='+', required=True)
+    parser.add_argument("--vessels", nargs='*', help="Vessel names (default: every vessel with reports)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--refresh", action="store_true", help="Rebuild cached vessel-years")
+    parser.add_argument("--output", default="fleet_legs.csv")
+    args = parser.parse_args()
+
+    written = 0
+    for vessel_name, year, legs in fleet_legs(get_db_engine(), get_leg_cache(), args.years, args.vessels,
+                                              get_port_index().spatial, args.chunksize, args.refresh):
+        legs.insert(0, 'year', year)
+        legs.insert(0, 'vessel', vessel_name)
+        legs.to_csv(args.output, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += len(legs)
+    print(f"Wrote {written} legs to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
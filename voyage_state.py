@@ -0,0 +1,123 @@
+from collections import Counter
+
+from cii_core import CIIError, calculate_cii_rating
+from tracing import annotate, span
+from voyage import evaluate_voyage
+
+TOTAL_KEYS = ['distance', 'co2_emissions', 'sea_time', 'port_time']
+
+
+def row_fingerprint(row):
+    """Hashable fingerprint of the inputs of a voyage row"""
+    return tuple(None if value is None or value != value else value for value in row)
+
+
+class VoyageState:
+    """Voyage segment metrics kept across reruns and recomputed only for changed rows.
+
+    Segment metrics are cached by row fingerprint, so edited, added or moved
+    rows are the only ones resolved and routed again (in one concurrent
+    batch), and voyage totals are adjusted by the difference instead of being
+    summed over every leg. Rows that failed are kept for the current rerun
+    only and evaluated again on the next one.
+    """
+
+    def __init__(self):
+        self._segments = {}
+        self._errors = {}
+        self._fingerprints = []
+        self.totals = dict.fromkeys(TOTAL_KEYS, 0.0)
+        self.legs = 0
+        self.changed = []
+
+    def _add(self, segment, sign):
+        if segment is not None and 'error' not in segment:
+            self.legs += sign
+            for key in TOTAL_KEYS:
+                self.totals[key] += sign * segment[key]
+
+    def update(self, rows, port_index, route_cache, distance_matrix=None, **options):
+        """Bring the state in line with the current voyage rows; returns the positions recomputed"""
+        with span('voyage_state.update', rows=len(rows)):
+            return self._update(rows, port_index, route_cache, distance_matrix, **options)
+
+    def _update(self, rows, port_index, route_cache, distance_matrix, **options):
+        fingerprints = [row_fingerprint(row) for row in rows]
+        pending = {}
+        for position, fingerprint in enumerate(fingerprints):
+            if fingerprint not in self._segments and fingerprint not in pending:
+                pending[fingerprint] = position
+        previous_errors = self._errors
+        self._errors = {}
+        if pending:
+            results = evaluate_voyage([rows[position] for position in pending.values()], port_index, route_cache,
+                                      distance_matrix, **options)
+            for fingerprint, result in zip(pending, results):
+                if result is not None and 'error' in result:
+                    # Not cached, so a transient routing or resolution failure is retried
+                    self._errors[fingerprint] = result
+                else:
+                    self._segments[fingerprint] = result
+
+        counts = Counter(fingerprints)
+        removed = Counter(self._fingerprints)
+        removed.subtract(counts)
+        for fingerprint, count in removed.items():
+            if fingerprint in previous_errors:
+                # Rows that failed before added nothing to the totals; add what they give now
+                count = -counts[fingerprint]
+            segment = self._segments.get(fingerprint)
+            for _ in range(abs(count)):
+                self._add(segment, -1 if count > 0 else 1)
+
+        if self.legs == 0:
+            # Drop the rounding residue of the additions and subtractions
+            self.totals = dict.fromkeys(TOTAL_KEYS, 0.0)
+        self._fingerprints = fingerprints
+        current = set(fingerprints)
+        for fingerprint in [fingerprint for fingerprint in self._segments if fingerprint not in current]:
+            del self._segments[fingerprint]
+        self.changed = [position for position, fingerprint in enumerate(fingerprints) if fingerprint in pending]
+        annotate(changed=len(self.changed))
+        return self.changed
+
+    def results(self):
+        """Per-row results in input order: None for incomplete rows, metrics or an 'error' dict otherwise"""
+        return [self._errors[fingerprint] if fingerprint in self._errors else self._segments[fingerprint]
+                for fingerprint in self._fingerprints]
+
+    def segments(self):
+        """Metrics of the legs that could be calculated"""
+        return [segment for segment in self.results() if segment is not None and 'error' not in segment]
+
+    def errors(self):
+        """One message per leg that failed"""
+        return [f"Leg {leg_number}: {segment['error']}"
+                for leg_number, segment in enumerate(self.results(), start=1)
+                if segment is not None and 'error' in segment]
+
+    def projection(self, current_data):
+        """Projected CII from the running totals, in the shape of calculate_projected_cii"""
+        if not self.legs:
+            return None
+        with span('projection'):
+            return self._projection(current_data)
+
+    def _projection(self, current_data):
+        capacity = current_data.get('capacity', 0)
+        if capacity <= 0:
+            raise CIIError("Error calculating projected CII: Invalid vessel capacity")
+
+        total_distance = current_data.get('total_distance', 0) + self.totals['distance']
+        total_co2 = current_data.get('co2_emission', 0) + self.totals['co2_emissions']
+        if total_distance <= 0:
+            raise CIIError("Error calculating projected CII: Total distance must be positive")
+        projected_aer = (total_co2 * 1000000) / (total_distance * capacity)
+        return {
+            'projected_aer': projected_aer,
+            'new_distance': self.totals['distance'],
+            'new_co2': self.totals['co2_emissions'],
+            'total_distance': total_distance,
+            'total_co2': total_co2,
+            'projected_rating': calculate_cii_rating(projected_aer, current_data['required_cii'])
+        }
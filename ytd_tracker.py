@@ -0,0 +1,176 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from queries import CII_RESULT_COLUMNS, FUEL_CO2_FACTORS, add_cii_columns, year_bounds
+
+# Reports dated this close to the high-water mark are re-read on every update,
+# so late or corrected noon reports replace what was counted before
+RESCAN_WINDOW = timedelta(days=3)
+
+# Report columns summed per vessel-year; consumption and FC_ columns alternate per fuel
+REPORT_COLUMNS = ['DISTANCE_TRAVELLED_ACTUAL'] + [
+    column for fuel in FUEL_CO2_FACTORS for column in (f'FUEL_CONSUMPTION_{fuel}', f'FC_FUEL_CONSUMPTION_{fuel}')
+]
+
+REPORTS_QUERY = text(f"""
+    SELECT
+        "VESSEL_IMO",
+        "REPORT_DATE",
+        {", ".join(f'"{column}"' for column in REPORT_COLUMNS)}
+    FROM
+        "sf_consumption_logs"
+    WHERE
+        "VESSEL_NAME" = :vessel_name
+        AND "REPORT_DATE" >= :since
+        AND "REPORT_DATE" < :end_date
+    ORDER BY
+        "REPORT_DATE"
+""").execution_options(query_name='ytd_reports')
+
+PARTICULARS_QUERY = text("""
+    SELECT "deadweight" AS "capacity", "vessel_type"
+    FROM "vessel_particulars"
+    WHERE "vessel_imo" = :imo
+""").execution_options(query_name='vessel_particulars')
+
+
+def report_readings(reports):
+    """Return per report the REPORT_COLUMNS values (missing as zero) followed by their non-null indicators.
+
+    Summed over reports, this gives the sum and non-null count of every
+    column, from which net_totals reproduces the NULL rules of the CII queries.
+    """
+    return readings(reports[REPORT_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float))
+
+
+def readings(values):
+    """report_readings of an (n, len(REPORT_COLUMNS)) float array with NaN for missing values"""
+    present = ~np.isnan(values)
+    return np.hstack([np.where(present, values, 0.0), present])
+
+
+def reported_fuels(totals):
+    """Per fuel, whether both its consumption and FC_ column have readings in summed report_readings"""
+    counts = totals[..., len(REPORT_COLUMNS):]
+    return (counts[..., 1::2] > 0) & (counts[..., 2::2] > 0)
+
+
+def net_totals(totals):
+    """Return (distance, net consumption per fuel) of summed report_readings, as the CII queries compute them.
+
+    SUM over no readings is NULL, so the distance is NaN without readings,
+    and COALESCE((SUM(F) - SUM(FC)) * factor, 0) counts nothing for a fuel
+    whose consumption or FC_ column has no readings.
+    """
+    sums, counts = totals[..., :len(REPORT_COLUMNS)], totals[..., len(REPORT_COLUMNS):]
+    distance = np.where(counts[..., 0] > 0, sums[..., 0], np.nan)
+    net = np.where(reported_fuels(totals), sums[..., 1::2] - sums[..., 2::2], 0.0)
+    return distance, net
+
+
+class VesselYearState:
+    """Running totals of one vessel-year and the reports inside the re-scan window"""
+
+    def __init__(self, vessel_name, year):
+        self.vessel_name = vessel_name
+        self.year = year
+        self.imo = None
+        self.capacity = None
+        self.vessel_type = None
+        self.totals = np.zeros(2 * len(REPORT_COLUMNS))
+        self.high_water_mark = None
+        self.recent_dates = np.array([], dtype='datetime64[ns]')
+        self.recent = np.zeros((0, 2 * len(REPORT_COLUMNS)))
+        # Result of the current totals, rebuilt only after they change
+        self.result = None
+        self.lock = threading.Lock()
+
+
+class YTDTracker:
+    """Incremental year-to-date accumulator over sf_consumption_logs.
+
+    The first update of a vessel-year sums its reports once; later updates
+    only fetch reports dated after the high-water mark minus RESCAN_WINDOW,
+    swap the re-read window reports for their current values and add the
+    new ones, so each update costs O(new reports). When the window comes back
+    unchanged, the previous result is returned as is. Sums and non-null counts
+    are kept per column, so results match fetch_vessel_data exactly.
+    """
+
+    def __init__(self, rescan_window=RESCAN_WINDOW):
+        self.rescan_window = rescan_window
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, vessel_name, year):
+        with self._lock:
+            key = (vessel_name, year)
+            if key not in self._states:
+                self._states[key] = VesselYearState(vessel_name, year)
+            return self._states[key]
+
+    def update(self, conn, vessel_name, year):
+        """Fold new reports into a vessel-year and return it in the shape of fetch_vessel_data"""
+        state = self._state(vessel_name, year)
+        start_date, end_date = year_bounds(year)
+        with state.lock:
+            since = datetime.combine(start_date, datetime.min.time())
+            if state.high_water_mark is not None:
+                since = max(since, (state.high_water_mark - self.rescan_window).to_pydatetime())
+
+            # Plain rows instead of pd.read_sql: warm updates read a handful of reports
+            rows = conn.execute(REPORTS_QUERY, {'vessel_name': vessel_name, 'since': since,
+                                                'end_date': end_date}).fetchall()
+            if rows:
+                self._apply(state, rows, pd.Timestamp(since))
+            if state.imo is not None and state.capacity is None:
+                particulars = pd.read_sql(PARTICULARS_QUERY, conn, params={'imo': state.imo})
+                if not particulars.empty:
+                    state.capacity = particulars['capacity'].iloc[0]
+                    state.vessel_type = particulars['vessel_type'].iloc[0]
+                    state.result = None
+            if state.result is None:
+                state.result = self.result(state)
+            return state.result.copy()
+
+    def _apply(self, state, rows, since):
+        report_dates = pd.to_datetime([row[1] for row in rows]).to_numpy(dtype='datetime64[ns]')
+        contributions = readings(np.array([row[2:] for row in rows], dtype=float))
+
+        # Window reports that were re-read unchanged leave the totals as they are
+        replaced = state.recent_dates >= since.to_datetime64()
+        if np.array_equal(state.recent_dates[replaced], report_dates) and \
+                np.array_equal(state.recent[replaced], contributions):
+            return
+        state.result = None
+
+        # Window reports that were re-read are replaced by their current values
+        state.totals -= state.recent[replaced].sum(axis=0)
+        state.totals += contributions.sum(axis=0)
+
+        state.imo = rows[-1][0]
+        state.high_water_mark = pd.Timestamp(report_dates.max())
+        window_start = (state.high_water_mark - self.rescan_window).to_datetime64()
+        kept = ~replaced & (state.recent_dates >= window_start)
+        in_window = report_dates >= window_start
+        state.recent_dates = np.concatenate([state.recent_dates[kept], report_dates[in_window]])
+        state.recent = np.concatenate([state.recent[kept], contributions[in_window]])
+
+    def result(self, state):
+        """Return the current totals of a vessel-year with CO2 and attained AER"""
+        if state.imo is None:
+            return pd.DataFrame(columns=CII_RESULT_COLUMNS)
+        distance, net = net_totals(state.totals)
+        row = dict(zip([fuel.lower() for fuel in FUEL_CO2_FACTORS], net))
+        row.update({
+            'total_distance': float(distance),
+            'Vessel': state.vessel_name,
+            'IMO': state.imo,
+            'capacity': np.nan if state.capacity is None else state.capacity,
+            'vessel_type': state.vessel_type
+        })
+        return add_cii_columns(pd.DataFrame([row]))[CII_RESULT_COLUMNS]